@@ -0,0 +1,323 @@
+from os.path import join, dirname, abspath
+from statistics import median
+from datetime import datetime
+from typing import Callable
+import subprocess
+import itertools
+import argparse
+import platform
+import tempfile
+import random
+import json
+import time
+import sys
+import os
+
+
+# headless benchmarks of the hot paths, on synthetic notes. `python sbench.py --help`
+#
+# benchmarks/<date>.json:
+#   {"version", "meta": {"created", "commit", "python", "platform", "cpus", "quick"},
+#    "results": {"<benchmark>[<param>=<value>]": {"benchmark", "params", "times", "min", "median"}}}
+# times are in seconds. --compare matches results by key, a median that got slower than the
+# tolerance allows is a regression (and a non zero exit code).
+
+RESULTS_VERSION = 1
+RESULTS_DIR = "./benchmarks/"
+TOLERANCE = 0.25 # slowdown allowed before a result counts as a regression
+CANVAS_SIZE = (600, 400) # same as an image block
+
+ERASER_STROKES = (10, 100, 1000, 10000)
+COMPILE_BLOCKS = ((10, 2), (50, 10)) # (text blocks, image blocks)
+STORAGE_BLOCKS = ((100, 10), (1000, 50))
+RERUN_BLOCKS = (10, 100, 1000)
+SIMPLIFY_STROKES = (10, 100, 1000)
+SIMPLIFY_TOLERANCE = 0.5
+
+
+def measure(run: Callable, setup: Callable | None = None, repeat: int = 5) -> list[float]:
+    """Times run(*setup()) repeat times, setup itself isn't timed."""
+
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+
+        start = time.perf_counter()
+        run(*args)
+        times.append(time.perf_counter() - start)
+
+    return times
+
+def result(benchmark: str, params: dict, times: list[float]) -> tuple[str, dict]:
+    key = f"{benchmark}[{','.join(f'{name}={value}' for name, value in params.items())}]"
+    return key, {"benchmark": benchmark, "params": params, "times": times, "min": min(times), "median": median(times)}
+
+
+# synthetic notes, seeded so every run measures the same work
+
+def stroke(rng: random.Random) -> dict:
+    """A freehand stroke like the ones fabric.js sends back, quadratic curves with a line at the end."""
+
+    width, height = CANVAS_SIZE
+    x, y = rng.uniform(0, width), rng.uniform(0, height)
+    commands = [["M", x, y]]
+
+    for _ in range(rng.randint(5, 40)):
+        cx, cy = x + rng.uniform(-10, 10), y + rng.uniform(-10, 10)
+        x, y = cx + rng.uniform(-10, 10), cy + rng.uniform(-10, 10)
+        commands.append(["Q", cx, cy, x, y])
+
+    commands.append(["L", x, y])
+    return {"type": "path", "left": 0, "top": 0, "stroke": "#ccc", "strokeWidth": 5, "path": commands}
+
+def eraser(rng: random.Random) -> dict:
+    width, height = CANVAS_SIZE
+    return {"type": "rect", "left": rng.uniform(0, width - 40), "top": rng.uniform(0, height - 40), "width": 40, "height": 40}
+
+def drawing(rng: random.Random, vectors: bool = False):
+    """An image block with a few light strokes on it, as simages.CompactImage. With vectors, canvas objects go along."""
+
+    from simages import CompactImage
+    import svectors as st_vx
+    import numpy as np
+
+    width, height = CANVAS_SIZE
+    array = np.zeros((height, width, 4), dtype=np.uint8)
+
+    for _ in range(rng.randint(3, 12)):
+        x, y = rng.uniform(0, width), rng.uniform(0, height)
+
+        for _ in range(rng.randint(20, 200)):
+            x = min(max(x + rng.uniform(-4, 4), 0), width - 3)
+            y = min(max(y + rng.uniform(-4, 4), 0), height - 3)
+            array[int(y):int(y) + 3, int(x):int(x) + 3] = (204, 204, 204, 255)
+
+    return CompactImage.from_array(array, st_vx.compact([stroke(rng) for _ in range(rng.randint(3, 12))]) if vectors else None)
+
+def text(rng: random.Random) -> str:
+    words = ["integral", "limit", "vector", "matrix", "proof", "lemma", "notes", "example", "field", "group"]
+    lines = [f"## {rng.choice(words).title()} {rng.randint(1, 99)}"]
+
+    for _ in range(rng.randint(2, 8)):
+        lines.append(" ".join(rng.choice(words) for _ in range(rng.randint(5, 15))) + f" $x^{rng.randint(2, 9)}$")
+
+    return "\n\n".join(lines)
+
+def records(text_blocks: int, image_blocks: int, seed: int = 0, vectors: bool = False) -> list:
+    """sstorage records of a notebook, the images spread evenly between the text."""
+
+    rng = random.Random(seed)
+    images = {round(i * text_blocks / max(image_blocks, 1)) for i in range(image_blocks)}
+    made = [(0, "title", "Benchmark")]
+
+    for i in range(text_blocks + 1):
+        if i in images:
+            made.append((len(made), "image", drawing(rng, vectors)))
+        if i < text_blocks:
+            made.append((len(made), "text", text(rng)))
+
+    return made
+
+
+# benchmarks, each one yields (key, result) pairs
+
+def bench_eraser(quick: bool):
+    """scanvas.remove_intersecting_lines with a spatial index (how the canvas calls it) and without one."""
+
+    import scanvas as st_ca
+
+    for n in ERASER_STROKES[:3] if quick else ERASER_STROKES:
+        rng = random.Random(n)
+        objects = [stroke(rng) for _ in range(n)]
+        repeat = 3 if n >= 10000 else 10
+
+        def indexed(): # the canvas syncs its index with the eraser rectangle already drawn
+            rect = eraser(rng)
+            index = st_ca.SpatialIndex()
+            index.sync(objects + [rect])
+            return objects + [rect], rect, index
+
+        def scanned():
+            rect = eraser(rng)
+            return objects + [rect], rect
+
+        index = st_ca.SpatialIndex()
+        yield result("canvas_index_sync", {"strokes": n}, measure(lambda: (index.clear(), index.sync(objects)), repeat=repeat))
+        yield result("eraser", {"strokes": n}, measure(st_ca.remove_intersecting_lines, indexed, repeat))
+        yield result("eraser_unindexed", {"strokes": n}, measure(st_ca.remove_intersecting_lines, scanned, repeat))
+
+def bench_simplify(quick: bool):
+    """scanvas.simplified on new strokes (what the canvas does with a tolerance), and the eraser on the results."""
+
+    import scanvas as st_ca
+
+    for n in SIMPLIFY_STROKES[:2] if quick else SIMPLIFY_STROKES:
+        rng = random.Random(n)
+        objects = [stroke(rng) for _ in range(n)]
+        simplified = [st_ca.simplified(obj, SIMPLIFY_TOLERANCE) for obj in objects]
+
+        def erasing():
+            rect = eraser(rng)
+            index = st_ca.SpatialIndex()
+            index.sync(simplified + [rect])
+            return simplified + [rect], rect, index
+
+        yield result("simplify", {"strokes": n}, measure(lambda: [st_ca.simplified(obj, SIMPLIFY_TOLERANCE) for obj in objects]))
+        yield result("eraser_simplified", {"strokes": n}, measure(st_ca.remove_intersecting_lines, erasing))
+
+def bench_compile(quick: bool):
+    """
+    sprinting.compile of whole notebooks, with the fragment cache empty (a first compile) and full (a recompile).
+    The images are drawn from their pixels, and from their canvas objects (vectors).
+    """
+
+    import sprinting as st_p
+
+    for (text_blocks, image_blocks), vectors in itertools.product(COMPILE_BLOCKS[:1] if quick else COMPILE_BLOCKS, (False, True)):
+        printable = [content for _, type, content in records(text_blocks, image_blocks, vectors=vectors)[1:]]
+        params = {"text": text_blocks, "images": image_blocks, **({"vectors": True} if vectors else {})}
+
+        def cold():
+            with st_p._fragments_lock:
+                st_p._fragments.clear()
+
+            return "Benchmark", printable
+
+        yield result("compile_source", params, measure(st_p.make_source, cold, 5))
+        yield result("compile", params, measure(st_p.compile, cold, 3))
+        yield result("compile_cached", params, measure(lambda: st_p.compile("Benchmark", printable), repeat=3))
+
+def bench_storage(quick: bool):
+    """The sstorage round trip behind save_notes/open_notes: full snapshot, journaled edit, open, open and draw every image."""
+
+    import sstorage as st_s
+    import simages as st_i
+
+    with tempfile.TemporaryDirectory() as directory:
+        for text_blocks, image_blocks in STORAGE_BLOCKS[:1] if quick else STORAGE_BLOCKS:
+            made = records(text_blocks, image_blocks)
+            path = join(directory, f"{text_blocks}_{image_blocks}.notes")
+            params = {"text": text_blocks, "images": image_blocks}
+
+            def edited():
+                i = next(i for i, (_, type, _) in enumerate(made) if type == "text")
+                id, type, content = made[i]
+                return path, len(made), made[:i] + [(id, type, content + ".")] + made[i + 1:], {id}
+
+            def opened():
+                with st_i._cache_lock:
+                    st_i._cache.clear()
+
+                return path,
+
+            def open_and_draw(path):
+                for _, type, content in st_s.load(path)[1]:
+                    if type == "image":
+                        content.array()
+
+            yield result("save", params, measure(lambda: st_s.save(path, len(made), made)))
+            yield result("save_journaled", params, measure(st_s.append, edited))
+            yield result("open", params, measure(st_s.load, opened))
+            yield result("open_images", params, measure(open_and_draw, opened))
+
+def bench_rerun(quick: bool):
+    """A main() rerun with nothing changed, in a headless script runner (streamlit's AppTest)."""
+
+    from streamlit.testing.v1 import AppTest
+
+    for n in RERUN_BLOCKS[:2] if quick else RERUN_BLOCKS:
+        at = AppTest.from_file(abspath(join(dirname(__file__), "snotesapp.py")), default_timeout=120).run()
+        app = at.session_state.app
+        Block = type(app.blocks[0])
+
+        app.set_blocks([Block(type, content, id) for id, type, content in records(n, n // 10)], n + n // 10 + 1)
+        at.run() # images decoded, fragments warm
+
+        yield result("rerun", {"blocks": n}, measure(at.run, repeat=5))
+
+
+BENCHMARKS = {
+    "eraser": bench_eraser,
+    "simplify": bench_simplify,
+    "compile": bench_compile,
+    "storage": bench_storage,
+    "rerun": bench_rerun,
+}
+
+
+def meta(quick: bool) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "quick": quick,
+    }
+
+def run(names: list[str], quick: bool = False) -> dict:
+    results = {}
+
+    for name in names:
+        try:
+            for key, value in BENCHMARKS[name](quick):
+                results[key] = value
+                print(f"  {key:<45} {value['median'] * 1000:10.2f}ms")
+
+        except Exception as e: # typst missing, no streamlit... the other benchmarks still run
+            print(f"  {name} failed: {e!r}")
+            results[name] = {"benchmark": name, "error": repr(e)}
+
+    return {"version": RESULTS_VERSION, "meta": meta(quick), "results": results}
+
+def compare(baseline: dict, current: dict, tolerance: float = TOLERANCE) -> list[str]:
+    """Prints every result next to the baseline's, returns the keys that regressed."""
+
+    regressed = []
+
+    for key, value in current["results"].items():
+        old = baseline["results"].get(key)
+        if old is None or "median" not in old or "median" not in value:
+            continue
+
+        ratio = value["median"] / old["median"] if old["median"] else float("inf")
+        flag = "REGRESSED" if ratio > 1 + tolerance else ""
+        print(f"  {key:<45} {old['median'] * 1000:10.2f}ms -> {value['median'] * 1000:10.2f}ms  {ratio:5.2f}x {flag}")
+
+        if flag:
+            regressed.append(key)
+
+    return regressed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless benchmarks of snotesapp's hot paths.")
+    parser.add_argument("benchmarks", nargs="*", choices=[[], *BENCHMARKS], help="which to run, all of them by default")
+    parser.add_argument("--quick", action="store_true", help="only the smaller workloads")
+    parser.add_argument("--output", help=f"results file, {RESULTS_DIR}<date>.json by default")
+    parser.add_argument("--compare", metavar="BASELINE", help="results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="slowdown allowed before failing the comparison")
+    args = parser.parse_args()
+
+    os.chdir(dirname(abspath(__file__))) # the compile reads ./template.typ, the app ./secrets.toml
+
+    current = run(args.benchmarks or list(BENCHMARKS), args.quick)
+
+    output = args.output or join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(dirname(abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(current, f, indent=1)
+
+    print(f"results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+        print(f"compared with {args.compare}:")
+        sys.exit(1 if compare(baseline, current, args.tolerance) else 0)
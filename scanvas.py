@@ -1,148 +1,317 @@
-import streamlit_drawable_canvas as st_cv
-from svgpathtools import parse_path
-import streamlit_extras.row as st_r
-from copy import deepcopy as copy
+from typing import TYPE_CHECKING
+from sconfig import SECRETS
+import sgeometry as st_g
+import shistory as st_h
+import sprofiler as st_pf
+import smemory as st_m
 import streamlit as st
 from PIL import Image
+import bisect
+import json
+import zlib
 import math
 
+if TYPE_CHECKING: # the component itself is loaded with the first canvas
+    import streamlit_drawable_canvas as st_cv
 
-# note: these functions may or may not have been written by AI
 
-def rect_to_path(rect):
-    """Convert a rectangle dict (assumes no rotation) into an svgpathtools Path."""
+@st_pf.profiled("eraser") # remove_intersecting_lines goes through here too
+def erased_positions(obj_list, rect_obj, index: "SpatialIndex | None" = None) -> set[int]:
+    """
+    Positions of the objects the eraser rectangle removes, the rectangle itself included.
+    With an index (in sync with obj_list) only the objects whose boxes overlap the rectangle are tested.
+    """
+
+    candidates = index.query(rect_obj) if index is not None else range(len(obj_list))
+    candidates = [i for i in candidates if obj_list[i] is not rect_obj]
+
+    # one batched kernel call for every candidate, the index already has their geometry flattened
+    shapes = index.shapes_at(candidates) if index is not None else None
+    erased = st_g.erased([obj_list[i] for i in candidates], rect_obj, shapes)
 
-    x, y, w, h = rect['left'], rect['top'], rect['width'], rect['height']
-    d = f"M {x},{y} L {x+w},{y} L {x+w},{y+h} L {x},{y+h} Z"
+    removed = {i for i, hit in zip(candidates, erased) if hit}
+    removed |= {i for i in range(len(obj_list) - 1, -1, -1) if obj_list[i] is rect_obj}
 
-    return parse_path(d)
+    return removed
 
-def commands_to_path(commands):
-    """Convert a list-of-commands (e.g., [['M', 10, 20], ['L', 30, 40]]) into a Path."""
+def remove_intersecting_lines(obj_list, rect_obj, index: "SpatialIndex | None" = None):
+    """
+    Given a list of SVG objects and a rectangle object (with type 'rect'),
+    return a new list with the rectangle removed and every path that
+    intersects the rectangle also removed.
+    With an index, it's updated to match the returned list.
+    """
+    
+    removed = erased_positions(obj_list, rect_obj, index)
+    new_objs = [obj for i, obj in enumerate(obj_list) if i not in removed]
 
-    d = " ".join(cmd[0] + " " + " ".join(map(str, cmd[1:])) for cmd in commands)
+    if index is not None:
+        index.remove(removed, new_objs)
+        
+    return new_objs
 
-    return parse_path(d)
 
-def path_intersects(path1, path2):
-    """Return True if any segment in path1 intersects any segment in path2."""
+def object_bbox(obj) -> tuple[float, float, float, float] | None:
+    """(x0, y0, x1, y1) containing everything the hit tests look at, None if it can't be erased."""
 
-    for seg1 in path1:
-        for seg2 in path2:
-            if seg1.intersect(seg2):
-                return True
-            
-    return False
+    if obj["type"] == "path":
+        coords = [value for command in obj["path"] for value in command[1:]]
+        if not coords:
+            return None
 
-def circle_to_path(circle_obj):
-    """
-    Convert a circle dict into an svgpathtools Path.
-    Assumes the circle always has originX 'left' and originY 'center'.
-    The center is computed as (left + radius, top).
-    """
+        # quadratic curves stay inside the box of their control points
+        xs, ys = coords[0::2], coords[1::2]
+        return min(xs), min(ys), max(xs), max(ys)
 
-    r = circle_obj['radius']
-    left = circle_obj['left']
-    top = circle_obj['top']
-    cx = left + r
-    cy = top
-
-    cx = circle_obj["left"] + circle_obj["radius"] * math.cos(circle_obj["angle"] * math.pi / 180)
-    cy = circle_obj["top"] + circle_obj["radius"] * math.sin(circle_obj["angle"] * math.pi / 180)
-    d = (
-        f"M {cx + r},{cy} "
-        f"A {r},{r} 0 1,0 {cx - r},{cy} "
-        f"A {r},{r} 0 1,0 {cx + r},{cy} Z"
-    )
-    return parse_path(d)
-
-def has_point_inside(path, rect):
+    elif obj["type"] == "line":
+        xs = obj["left"] + obj["x1"], obj["left"] + obj["x2"]
+        ys = obj["top"] + obj["y1"], obj["top"] + obj["y2"]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    elif obj["type"] == "circle":
+        r = obj["radius"]
+        cx = obj["left"] + r * math.cos(obj["angle"] * math.pi / 180)
+        cy = obj["top"] + r * math.sin(obj["angle"] * math.pi / 180)
+        return cx - r, cy - r, cx + r, cy + r
+
+    return None
+
+def fingerprint(obj) -> tuple:
+    return (obj["type"], obj.get("left"), obj.get("top"), obj.get("width"), obj.get("height"))
+
+
+INDEX_CELL = 64 # side of a grid cell, in canvas pixels
+INDEX_DELETES = 64 # erasing more objects than this at once rebuilds the slot list instead of deleting from it
+
+class SpatialIndex:
     """
-    Check if any coordinate point in the commands list is inside the rectangle.
-    Assumes commands have coordinate pairs starting at index 1.
+    Uniform grid over the bounding boxes of the erasable objects of a canvas.
+    Objects get a slot when they're indexed, slots don't move when earlier objects are erased.
     """
 
-    x0, y0 = rect['left'], rect['top']
-    x1, y1 = x0 + rect['width'], y0 + rect['height']
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self.slots: list[int] = [] # slot of the object at each position of the object list, increasing
+        self.boxes: dict[int, tuple] = {} # slot -> bounding box, only for erasable objects
+        self.shapes: dict[int, st_g.Shape | None] = {} # slot -> flattened geometry, None if the kernel can't take it
+        self.cells: dict[tuple[int, int], set[int]] = {}
+        self.next_slot = 0
+        self.last = None # fingerprint of the last indexed object, to notice a replaced list
+
+    def cells_of(self, box):
+        x0, y0, x1, y1 = box
+
+        for cx in range(math.floor(x0 / INDEX_CELL), math.floor(x1 / INDEX_CELL) + 1):
+            for cy in range(math.floor(y0 / INDEX_CELL), math.floor(y1 / INDEX_CELL) + 1):
+                yield cx, cy
+
+    def add(self, obj) -> None:
+        slot = self.next_slot
+        self.next_slot += 1
+        self.slots.append(slot)
+        self.last = fingerprint(obj)
+
+        shape = st_g.flatten(obj) if obj["type"] in st_g.ERASABLE else None
+        box = shape.box if shape is not None else object_bbox(obj)
+        if box is None:
+            return
+
+        self.boxes[slot] = box
+        self.shapes[slot] = shape
+        for cell in self.cells_of(box):
+            self.cells.setdefault(cell, set()).add(slot)
 
-    def check_single_point(px, py):
-        if x0 <= px <= x1 and y0 <= py <= y1:
-            return True
+    def sync(self, objects) -> None:
+        """Indexes objects appended since the last sync, rebuilds if the list was replaced some other way."""
+
+        known = len(self.slots)
+
+        if len(objects) < known or (known and fingerprint(objects[known - 1]) != self.last):
+            self.clear()
+            known = 0
+
+        for obj in objects[known:]:
+            self.add(obj)
+
+    def query(self, rect_obj) -> list[int]:
+        """Positions of the objects whose boxes overlap the rectangle, in order."""
+
+        x0, y0 = rect_obj["left"], rect_obj["top"]
+        x1, y1 = x0 + rect_obj["width"], y0 + rect_obj["height"]
+
+        slots = set()
+        for cell in self.cells_of((x0, y0, x1, y1)):
+            slots |= self.cells.get(cell, set())
+
+        hits = []
+        for slot in slots:
+            bx0, by0, bx1, by1 = self.boxes[slot]
+            if bx0 <= x1 and x0 <= bx1 and by0 <= y1 and y0 <= by1:
+                hits.append(slot)
+
+        # slots only grow along the list, a slot's position is found without walking it
+        return sorted(bisect.bisect_left(self.slots, slot) for slot in hits)
+
+    def shapes_at(self, positions: list[int]) -> list["st_g.Shape | None"]:
+        return [self.shapes.get(self.slots[i]) for i in positions]
+
+    def remove(self, positions: set[int], objects) -> None:
+        """Drops the objects at positions, objects is the list that's left."""
+
+        for i in positions:
+            slot = self.slots[i]
+            box = self.boxes.pop(slot, None)
+            self.shapes.pop(slot, None)
+
+            if box is not None:
+                for cell in self.cells_of(box):
+                    self.cells[cell].discard(slot)
+
+        if len(positions) <= INDEX_DELETES: # each del moves the tail in C, fewer than walking it in python
+            for i in sorted(positions, reverse=True):
+                del self.slots[i]
         else:
-            return False
+            self.slots = [slot for i, slot in enumerate(self.slots) if i not in positions]
+
+        self.last = fingerprint(objects[-1]) if objects else None
 
-    for t in path:
-        if t[0] in "ML":
-            if check_single_point(t[1], t[2]):
-                return True
 
-        elif t[0] == "Q":
-            if check_single_point(t[1], t[2]) or check_single_point(t[3], t[4]):
-                return True
-            
-    return False
+SIMPLIFY_TOLERANCE = SECRETS.get("stroke_tolerance") # in canvas pixels, strokes are kept as drawn when it's not set
 
-def circle_intersects_rect(circle_obj, rect):
+def simplified(obj, tolerance: float | None):
     """
-    Check if a circle intersects an axis-aligned rectangle.
-    Assumes the circle has originX 'left' and originY 'center', so its center is (left + radius, top).
+    The object, or a copy of a freehand stroke with fewer points (see sgeometry.simplify_commands).
+    Strokes already made of lines only are left alone, simplifying them again would drift further.
     """
-    r = circle_obj['radius']
-    cx = circle_obj['left'] + r
-    cy = circle_obj['top']
-    cx = circle_obj["left"] + circle_obj["radius"] * math.cos(circle_obj["angle"] * math.pi / 180)
-    cy = circle_obj["top"] + circle_obj["radius"] * math.sin(circle_obj["angle"] * math.pi / 180)
-    rx, ry = rect['left'], rect['top']
-    rw, rh = rect['width'], rect['height']
-    # Find the closest point on the rectangle to the circle's center
-    closest_x = max(rx, min(cx, rx + rw))
-    closest_y = max(ry, min(cy, ry + rh))
-    dist_sq = (cx - closest_x) ** 2 + (cy - closest_y) ** 2
-    return dist_sq < r * r
-
-def remove_intersecting_lines(obj_list, rect_obj):
+
+    if not tolerance or obj["type"] != "path" or all(command[0] != "Q" for command in obj["path"]):
+        return obj
+
+    commands = st_g.simplify_commands(obj["path"], tolerance)
+    if commands is None:
+        return obj
+
+    new_obj = {**obj, "path": commands}
+
+    # fabric.js keeps left and top when it loads a path and measures its size again, pencil strokes sit
+    # at their path's box (less half the stroke) so the box of the new one has to be where they are
+    if obj.get("originX", "left") == "left" and obj.get("originY", "top") == "top" and not obj.get("angle") \
+        and obj.get("scaleX", 1) == 1 and obj.get("scaleY", 1) == 1:
+        xs, ys = [command[1] for command in commands], [command[2] for command in commands]
+        half = obj.get("strokeWidth", 0) / 2
+        new_obj.update(left=round(min(xs) - half, 4), top=round(min(ys) - half, 4),
+            width=round(max(xs) - min(xs), 4), height=round(max(ys) - min(ys), 4)) # fabric's NUM_FRACTION_DIGITS
+
+    return new_obj
+
+
+HASH_BASE = 1_000_003
+HASH_MODULUS = (1 << 61) - 1
+
+def record_hash(obj) -> int:
+    return zlib.crc32(json.dumps(obj, sort_keys=True, separators=(",", ":")).encode())
+
+class CanvasState:
     """
-    Given a list of SVG objects and a rectangle object (with type 'rect'),
-    return a new list with the rectangle removed and every path that
-    intersects the rectangle also removed.
+    Immutable version of a canvas drawing: its first count objects plus a rolling hash over them.
+    Versions share their object records (never mutated once they're in a version) and the lists
+    holding them, so appending strokes to the newest version doesn't copy anything.
     """
-    
-    rect_path = rect_to_path(rect_obj)
-    new_objs = []
-    
-    for obj in obj_list:
-        if obj is rect_obj:
-            continue
-        
-        elif obj["type"] == "path":
-            if has_point_inside(obj["path"], rect_obj) or path_intersects(commands_to_path(obj["path"]), rect_path):
-                continue
-
-        elif obj["type"] == "line":
-            temp = [
-                ("M", obj["left"] + obj["x1"], obj["top"] + obj["y1"]),
-                ("L", obj["left"] + obj["x2"], obj["top"] + obj["y2"])
-            ]
-            
-            if has_point_inside(temp, rect_obj) or path_intersects(commands_to_path(temp), rect_path):
-                continue
-
-        elif obj["type"] == "circle":
-            if circle_intersects_rect(obj, rect_obj) or path_intersects(circle_to_path(obj), rect_path):
-                continue
-
-        new_objs.append(obj)
-        
-    return new_objs
+
+    __slots__ = ("records", "hashes", "prefix", "count", "extra")
+
+    def __init__(self, records: list | None = None, hashes: list[int] | None = None, prefix: list[int] | None = None,
+        count: int = 0, extra: dict | None = None):
+        self.records = records if records is not None else [] # shared, only ever appended to
+        self.hashes = hashes if hashes is not None else [] # hash of each record
+        self.prefix = prefix if prefix is not None else [0] # rolling hash of the first i records
+        self.count = count
+        self.extra = extra or {} # everything in the fabric json besides the objects (version, background)
+
+    @classmethod
+    def from_json(cls, json_data: dict | None) -> "CanvasState":
+        if not json_data:
+            return cls()
+
+        return cls(extra={k: v for k, v in json_data.items() if k != "objects"}).extend(json_data["objects"])
+
+    @property
+    def digest(self) -> int:
+        return self.prefix[self.count]
+
+    @property
+    def objects(self) -> list:
+        """The records of this version. Don't modify them, other versions share them."""
+
+        return self.records[:self.count] if self.count < len(self.records) else self.records
+
+    def last(self):
+        return self.records[self.count - 1] if self.count else None
+
+    def extend(self, objects, hashes: list[int] | None = None) -> "CanvasState":
+        """New version with objects appended, in place when this is the newest version of the lists."""
+
+        hashes = hashes if hashes is not None else [record_hash(obj) for obj in objects]
+
+        if self.count == len(self.records):
+            records, record_hashes, prefix = self.records, self.hashes, self.prefix
+        else: # an older version, branch off
+            records, record_hashes, prefix = self.records[:self.count], self.hashes[:self.count], self.prefix[:self.count + 1]
+
+        for obj, h in zip(objects, hashes):
+            records.append(obj)
+            record_hashes.append(h)
+            prefix.append((prefix[-1] * HASH_BASE + h + 1) % HASH_MODULUS)
+
+        return CanvasState(records, record_hashes, prefix, len(records), self.extra)
+
+    def without(self, positions: set[int]) -> "CanvasState":
+        """New version without the objects at positions. Record hashes are reused, nothing is serialized again."""
+
+        kept = [i for i in range(self.count) if i not in positions]
+        return CanvasState(extra=self.extra).extend([self.records[i] for i in kept], [self.hashes[i] for i in kept])
+
+    def update(self, json_data: dict | None, returned: dict | None = None, tolerance: float | None = None) -> "CanvasState":
+        """
+        Version matching what the canvas returned. The drawing tools only ever append objects, so if the
+        object this version ends with is still in its place only the new ones are looked at, otherwise
+        (an undo on the canvas, a cleared or replaced drawing) it's rebuilt.
+        returned is the json this version was made from, the canvas still has those objects where the
+        records can be simplified strokes. New strokes are simplified with tolerance, if it's given.
+        """
+
+        if not json_data:
+            return CanvasState()
+
+        objects = json_data["objects"]
+        drawn = returned["objects"] if returned is not None and len(returned["objects"]) == self.count else self.objects
+
+        if self.count and len(objects) >= self.count and objects[self.count - 1] == drawn[self.count - 1]:
+            if len(objects) == self.count:
+                return self
+
+            return self.extend([simplified(obj, tolerance) for obj in objects[self.count:]])
+
+        return CanvasState.from_json({**json_data, "objects": [simplified(obj, tolerance) for obj in objects]})
+
+    def to_json(self) -> dict:
+        return {**self.extra, "objects": list(self.objects)}
 
 
 class App:
     def __init__(self):
         self.key = 0
         self.regen_key()
-        self.json_data = None
-        self.buffer = None
+        self.json_data = None # initial drawing handed to the canvas
+        self.saved = CanvasState() # version json_data was made from
+        self.buffer = CanvasState() # latest version the canvas returned
+        self.returned = None # json the canvas returned last, it's handed back as is when nothing happened
+        self.index = SpatialIndex() # over the objects in buffer
         self.drawing_mode = "freedraw"
+        self.spilled = None # the drawing, while it's moved to disk (see spill), get_app brings it back
+        self._nbytes = (None, 0) # (what it was measured on, bytes)
 
     def get_key(self):
         self.key += 1
@@ -152,8 +321,77 @@ class App:
     def regen_key(self):
         self.curr_key = f"canvas_{self.get_key()}"
 
+    def nbytes(self) -> int:
+        """Rough memory it holds, only measured again when the drawing changes."""
+
+        version = (id(self.buffer), self.buffer.count, id(self.saved), id(self.returned), id(self.json_data))
+        if self._nbytes[0] != version:
+            self._nbytes = (version, st_m.deep_size((self.json_data, self.saved, self.buffer, self.returned, self.index)))
+
+        return self._nbytes[1]
+
+    def unspill(self) -> None:
+        state = CanvasState.from_json(json.loads(self.spilled.read()))
+        self.buffer = self.saved = state
+        self.json_data = state.to_json() if state.count else None
+        self.spilled = None
+
 def get_app(key) -> App:
-    return st.session_state.canvas[key]
+    app = st.session_state.canvas[key]
+
+    if app.spilled is not None:
+        app.unspill()
+
+    return app
+
+def spill(key: str, write) -> None:
+    """
+    Moves the drawing of a canvas that isn't shown to disk. write(bytes) stores them, returning
+    something with a read(). Its index and the json the canvas last returned are rebuilt when it's back.
+    """
+
+    canvas_save(key) # json_data has to be the latest version, the canvas is remounted with it
+    app = get_app(key)
+
+    app.spilled = write(json.dumps(app.buffer.to_json(), separators=(",", ":")).encode())
+    app.json_data = None
+    app.saved = app.buffer = CanvasState()
+    app.returned = None
+    app.index = SpatialIndex()
+
+def restore(key: str, state: CanvasState) -> None:
+    """Puts the canvas back to an earlier version, it's remounted with it the next time it's shown."""
+
+    app = get_app(key)
+    app.buffer = app.saved = state
+    app.json_data = state.to_json() if state.count else None
+    app.returned = None
+    app.index = SpatialIndex()
+    app.regen_key()
+
+
+class CanvasChange(st_h.Delta):
+    """Objects added to or erased from a canvas, as the versions before and after (they share their records)."""
+
+    def __init__(self, key: str, before: CanvasState, after: CanvasState):
+        self.key = key
+        self.before = before
+        self.after = after
+
+    def undo(self) -> None:
+        restore(self.key, self.before)
+
+    def redo(self) -> None:
+        restore(self.key, self.after)
+
+    def nbytes(self) -> int:
+        if self.after.records is self.before.records: # strokes added, only they are new
+            return sum(len(json.dumps(obj)) for obj in self.after.records[self.before.count:self.after.count])
+
+        # erased or rebuilt, the versions have their own lists now and the removed records stay alive here
+        kept = {id(obj) for obj in self.after.objects}
+        removed = sum(len(json.dumps(obj)) for obj in self.before.objects if id(obj) not in kept)
+        return removed + 64 * self.after.count
 
 
 TARGET_FILL = "#c751c6"
@@ -164,9 +402,15 @@ def canvas_save(key: str = "canvas"):
     if "canvas" not in st.session_state or key not in st.session_state.canvas:
         return
 
-    if get_app(key).json_data != get_app(key).buffer:
-        get_app(key).json_data = copy(get_app(key).buffer)
+    if st.session_state.canvas[key].spilled is not None: # saved before it was spilled, nothing changed since
+        return
 
+    app = get_app(key)
+    if app.saved.count != app.buffer.count or app.saved.digest != app.buffer.digest:
+        app.json_data = app.buffer.to_json() if app.buffer.count else None
+        app.saved = app.buffer
+
+@st_pf.profiled("canvas")
 def canvas(
     fill_color: str = "#eee",
     stroke_width: int = 5,
@@ -178,9 +422,17 @@ def canvas(
     display_toolbar: bool = True,
     additional_toolbar: bool = True,
     point_display_radius: int = 3,
-    key: str = "canvas"
-) -> st_cv.CanvasResult:
-    """Canvas element, expanded from streamlit-drawable-canvas. Supports more built in toolbar features, preserving state, erasing tool, and more."""
+    key: str = "canvas",
+    rerun_scope: str = "app",
+    simplify: float | None = SIMPLIFY_TOLERANCE
+) -> "st_cv.CanvasResult":
+    """
+    Canvas element, expanded from streamlit-drawable-canvas. Supports more built in toolbar features, preserving state, erasing tool, and more.
+    rerun_scope is what reruns after clearing or erasing, "fragment" if the canvas is inside one.
+    simplify is how far (in pixels) finished freehand strokes can be moved to drop points, None keeps them as drawn.
+    """
+
+    import streamlit_drawable_canvas as st_cv # loaded with the first canvas, not at startup
 
     if fill_color == TARGET_FILL:
         st.toast(f"Can't use fill color {TARGET_FILL}! (Reserved for internal functionality)")
@@ -199,13 +451,13 @@ def canvas(
 
     with second_placeholder.container():
         # todo actually listen to display_toolbar
-        row = st_r.row([5, 1], vertical_align="bottom")
+        col1, col2 = st.columns([5, 1], vertical_alignment="bottom")
 
-        tool = row.selectbox(
+        tool = col1.selectbox(
             "Tool:",
             ("freedraw", "eraser", "line", "rect", "circle", "polygon", "point"),
         )
-        do_clear = row.button("", icon=":material/replay:", help="Clear the canvas")
+        do_clear = col2.button("", icon=":material/replay:", help="Clear the canvas")
         real_tool = tool
 
         if tool == "eraser":
@@ -232,28 +484,46 @@ def canvas(
         #//st.text(get_app(key).curr_key)
 
     with second_placeholder.container():
-        if canvas_result.json_data is not None and canvas_result.json_data["objects"]:
-            if canvas_result.json_data != get_app(key).buffer:
-                edited = True
+        if canvas_result.json_data is not None and canvas_result.json_data["objects"] and canvas_result.json_data is not get_app(key).returned:
+            with st_pf.timed("canvas.json"):
+                previous = get_app(key).buffer
+                get_app(key).buffer = previous.update(canvas_result.json_data, get_app(key).returned, simplify)
+                get_app(key).returned = canvas_result.json_data
+                edited = get_app(key).buffer.count != previous.count or get_app(key).buffer.digest != previous.digest
+
+                if edited:
+                    st_h.record(CanvasChange(key, previous, get_app(key).buffer))
 
-            get_app(key).buffer = canvas_result.json_data
+                get_app(key).index.sync(get_app(key).buffer.objects)
             #//st.json(get_app().buffer, expanded=True)
 
         if do_clear:
+            st_h.record(CanvasChange(key, get_app(key).buffer, CanvasState()))
             get_app(key).regen_key()
             get_app(key).json_data = None
-            get_app(key).buffer = None
-            st.rerun()
+            get_app(key).saved = CanvasState()
+            get_app(key).buffer = CanvasState()
+            get_app(key).returned = None
+            get_app(key).index = SpatialIndex()
+            st.rerun(scope=rerun_scope)
 
         if tool == "eraser":
-            if edited and get_app(key).buffer and get_app(key).buffer["objects"]: # dunno if the second part is redundant
-                rect = get_app(key).buffer["objects"][-1]
+            if edited and get_app(key).buffer.count: # dunno if the second part is redundant
+                rect = get_app(key).buffer.last()
 
                 if rect["type"] == "rect" and rect["fill"] == TARGET_FILL: # our erasing rect
+                    removed = erased_positions(get_app(key).buffer.objects, rect, get_app(key).index)
+                    before = get_app(key).buffer
+
                     get_app(key).regen_key()
-                    get_app(key).json_data = copy(get_app(key).buffer)
-                    get_app(key).json_data["objects"] = remove_intersecting_lines(get_app(key).buffer["objects"], rect)
-                    st.rerun()
+                    get_app(key).buffer = get_app(key).buffer.without(removed)
+                    get_app(key).returned = None # it's remounted with the buffer
+                    st_h.record(CanvasChange(key, before, get_app(key).buffer)) # same step as the rectangle
+                    get_app(key).index.remove(removed, get_app(key).buffer.objects)
+                    with st_pf.timed("canvas.json"):
+                        get_app(key).json_data = get_app(key).buffer.to_json()
+                    get_app(key).saved = get_app(key).buffer
+                    st.rerun(scope=rerun_scope)
 
     return canvas_result
 
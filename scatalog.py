@@ -0,0 +1,130 @@
+from os.path import join, basename, dirname, exists
+from base64 import b64encode
+from threading import Lock
+import ssidecars as st_sd
+import sstorage as st_s
+from PIL import Image
+import io
+import os
+
+
+# .catalog.json and .catalog.journal, next to the notes they describe (see ssidecars), entries are
+#   {"stat", "title", "text_blocks", "image_blocks", "size", "modified", "thumbnail"}
+# stat is sstorage.file_stat, an entry is only rebuilt (reading the file's manifest) when it changes.
+# thumbnail is a small base64 png of the first drawing, None if there's none.
+
+CATALOG_NAME = ".catalog.json"
+JOURNAL_NAME = ".catalog.journal"
+CATALOG_VERSION = 1
+THUMBNAIL_SIZE = (120, 90)
+
+
+def thumbnail(records: list[st_s.Record]) -> str | None:
+    """Base64 png of the first drawing that isn't blank, scaled down."""
+
+    for _, type, content in records:
+        if type != "image":
+            continue
+
+        image = st_s.compact(content)
+        if image is None or image.bbox is None:
+            continue
+
+        height, width = image.shape
+        top, left, _, _ = image.bbox
+
+        canvas = Image.new("RGBA", (width, height))
+        canvas.paste(Image.fromarray(image.crop()), (left, top))
+        canvas.thumbnail(THUMBNAIL_SIZE)
+
+        buffer = io.BytesIO()
+        canvas.save(buffer, "PNG")
+        return b64encode(buffer.getvalue()).decode()
+
+    return None
+
+def describe(records: list[st_s.Record], stat: list[int]) -> dict:
+    return {
+        "stat": stat,
+        "title": next((content for _, type, content in records if type == "title"), None),
+        "text_blocks": sum(type == "text" for _, type, _ in records),
+        "image_blocks": sum(type == "image" for _, type, _ in records),
+        "size": sum(stat[1::2]),
+        "modified": max(stat[0::2]) / 1e9,
+        "thumbnail": thumbnail(records),
+    }
+
+
+class Catalog:
+    """Titles, sizes, dates and thumbnails of every notes file in a directory, without opening them."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.stored = st_sd.EntryFile(join(directory, CATALOG_NAME), join(directory, JOURNAL_NAME), CATALOG_VERSION)
+        self.lock = Lock()
+        self.files: dict[str, dict] = {}
+
+        try:
+            self.stored.load(self.apply)
+        except (OSError, ValueError, KeyError):
+            self.files = {} # rebuilt by refresh()
+
+    def apply(self, name: str, entry: dict | None) -> None:
+        if entry is not None:
+            self.files[name] = entry
+        else:
+            self.files.pop(name, None)
+
+    def update(self, path: str, records: list[st_s.Record]) -> None:
+        """Describes one file again, from the records just saved to it."""
+
+        with self.lock:
+            self.files[basename(path)] = describe(records, st_s.file_stat(path))
+            self.stored.append(basename(path), self.files)
+
+    def refresh(self) -> dict[str, dict]:
+        """Catches up with files added, changed or removed behind its back, returns every entry by name."""
+
+        with self.lock:
+            changed = False
+            names = {name for name in os.listdir(self.directory)
+                if not name.startswith(".") and os.path.isfile(join(self.directory, name))} if exists(self.directory) else set()
+
+            for name in self.files.keys() - names:
+                del self.files[name]
+                changed = True
+
+            for name in names:
+                path = join(self.directory, name)
+
+                try:
+                    stat = st_s.file_stat(path)
+                    if name in self.files and self.files[name]["stat"] == stat:
+                        continue
+
+                    try:
+                        # the manifest, plus the first drawing for the thumbnail. older (pickled) files are listed
+                        # without reading them, unpickling runs whatever is in them, they're migrated when opened
+                        records = st_s.load(path)[1] if st_s.is_container(path) else []
+                    except Exception:
+                        records = [] # not notes, or broken, still listed so it can be seen
+
+                    self.files[name] = describe(records, stat)
+                    changed = True
+
+                except FileNotFoundError: # removed while scanning
+                    continue
+
+            if changed:
+                self.stored.save(self.files)
+
+            return dict(self.files)
+
+
+def get_catalog(directory: str) -> Catalog:
+    return st_sd.shared(Catalog, directory)
+
+def update(path: str, records: list[st_s.Record]) -> None:
+    """Called after a save, describes the notes at path again."""
+
+    get_catalog(dirname(path)).update(path, records)
@@ -0,0 +1,25 @@
+from os.path import exists
+import tomli
+
+
+SECRETS_PATH = "./secrets.toml"
+
+DEFAULT_SECRETS = """
+author = "Anonymous"
+data_dir = "./data/"
+months_language = "en" # supported: "en", "es"
+"""
+
+
+def load() -> dict:
+    """Reads secrets.toml, writing the defaults first if there's none yet."""
+
+    if not exists(SECRETS_PATH): # it used to check ./secret.toml, so the defaults overwrote it on every run
+        with open(SECRETS_PATH, "w") as f:
+            f.write(DEFAULT_SECRETS)
+
+    with open(SECRETS_PATH, "rb") as f:
+        return tomli.load(f)
+
+# read once per process, every module shares it
+SECRETS = load()
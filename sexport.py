@@ -0,0 +1,157 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from os.path import join, basename, splitext, exists
+from sconfig import SECRETS
+import sprinting as st_p
+import sstorage as st_s
+import ssearch as st_se
+import argparse
+import hashlib
+import json
+import time
+import sys
+import os
+
+
+# batch export, `python sexport.py --help`. run it from the app's directory, like `streamlit run`.
+#
+# <output>/.exports.json:
+#   {"version", "template", "files": {name: {"stat", "hash", "pdf", "seconds"}}}
+# template is a sha1 of template.typ, when it changes every pdf is stale. a notebook whose stat
+# changed is hashed again (sstorage file and journal, see ssearch.file_hash) and only exported
+# if the hash did too.
+
+EXPORTS_NAME = ".exports.json"
+EXPORTS_VERSION = 1
+OUTPUT_DIR = "./exports/"
+
+
+def template_hash() -> str:
+    with open("./template.typ", "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def pdf_name(name: str) -> str:
+    return splitext(name)[0] + ".pdf"
+
+def export(path: str, pdf: str) -> float:
+    """Compiles the notes at path into pdf, returns the seconds it took. Runs in the pool's processes."""
+
+    start = time.perf_counter()
+    title, printable = st_p.make_printable(st_s.load(path)[1])
+    data = st_p.compile(title, printable)
+
+    st_s.write_atomic(pdf, lambda f: f.write(data))
+    return time.perf_counter() - start
+
+
+def worker_init() -> None:
+    st_p.IMAGE_WORKERS = 1 # every core already runs a compile, no threads on top
+
+
+class Exports:
+    """What's been exported to a directory, and from which version of each notebook."""
+
+    def __init__(self, output: str):
+        self.path = join(output, EXPORTS_NAME)
+        self.template = template_hash()
+        self.files: dict[str, dict] = {}
+
+        if exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    stored = json.load(f)
+
+                if stored.get("version") == EXPORTS_VERSION and stored.get("template") == self.template:
+                    self.files = stored["files"]
+            except (OSError, ValueError, KeyError):
+                self.files = {} # everything is exported again
+
+    def save(self) -> None:
+        data = json.dumps({"version": EXPORTS_VERSION, "template": self.template, "files": self.files}).encode()
+        st_s.write_atomic(self.path, lambda f: f.write(data))
+
+    def stale(self, name: str, path: str, pdf: str) -> tuple[list[int], str | None]:
+        """Stat and hash of the notes, hash is None if its pdf is still up to date."""
+
+        stat = st_s.file_stat(path)
+        entry = self.files.get(name)
+
+        if entry is None or not exists(pdf):
+            return stat, st_se.file_hash(path)
+
+        if entry["stat"] == stat:
+            return stat, None
+
+        hash = st_se.file_hash(path)
+        if hash == entry["hash"]: # touched, not changed
+            entry["stat"] = stat
+            return stat, None
+
+        return stat, hash
+
+
+def run(data_dir: str, output: str, workers: int | None = None, force: bool = False) -> int:
+    """Exports every notebook in data_dir that changed since its last export, returns how many failed."""
+
+    os.makedirs(output, exist_ok=True)
+    exports = Exports(output)
+
+    names = sorted(name for name in os.listdir(data_dir) if st_se.is_notes(name) and os.path.isfile(join(data_dir, name)))
+    for name in exports.files.keys() - set(names): # removed from the archive, the pdf is left alone
+        del exports.files[name]
+
+    pending = {}
+    for name in names:
+        path, pdf = join(data_dir, name), join(output, pdf_name(name))
+        stat, hash = exports.stale(name, path, pdf)
+
+        if force and hash is None:
+            hash = st_se.file_hash(path)
+
+        if hash is None:
+            print(f"  {name:<40} unchanged")
+        else:
+            pending[name] = (path, pdf, stat, hash)
+
+    failed = 0
+    start = time.perf_counter()
+
+    # biggest first, so a large notebook doesn't start last and keep the others waiting
+    order = sorted(pending, key=lambda name: sum(pending[name][2][1::2]), reverse=True)
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=worker_init) as pool:
+        futures = {pool.submit(export, pending[name][0], pending[name][1]): name for name in order}
+
+        for future in as_completed(futures):
+            name = futures[future]
+            path, pdf, stat, hash = pending[name]
+
+            try:
+                seconds = future.result()
+            except BrokenProcessPool: # a worker died (out of memory...), the rest of the pool with it
+                failed += 1
+                print(f"  {name:<40} failed: the worker process died")
+                continue
+            except Exception as e:
+                failed += 1
+                print(f"  {name:<40} failed: {str(e) or repr(e)}")
+                continue
+
+            exports.files[name] = {"stat": stat, "hash": hash, "pdf": basename(pdf), "seconds": seconds}
+            print(f"  {name:<40} {seconds:8.2f}s")
+
+    exports.save()
+    print(f"{len(pending) - failed} exported, {len(names) - len(pending)} unchanged, {failed} failed in {time.perf_counter() - start:.1f}s")
+
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compiles every notebook in the data directory to a pdf.")
+    parser.add_argument("--data-dir", default=SECRETS["data_dir"], help="notes to export, data_dir in secrets.toml by default")
+    parser.add_argument("--output", default=OUTPUT_DIR, help=f"where the pdfs go, {OUTPUT_DIR} by default")
+    parser.add_argument("--workers", type=int, help="processes compiling at once, one per core by default")
+    parser.add_argument("--force", action="store_true", help="export unchanged notebooks too")
+    args = parser.parse_args()
+
+    sys.exit(1 if run(args.data_dir, args.output, args.workers, args.force) else 0)
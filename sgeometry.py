@@ -0,0 +1,447 @@
+import numpy as np
+import random
+import math
+
+
+# reference hit tests, built on svgpathtools. they're what the eraser used to run on every object,
+# now they only handle what flatten() can't, and check_kernel() compares the kernel against them.
+
+# note: these functions may or may not have been written by AI
+
+def rect_to_path(rect):
+    """Convert a rectangle dict (assumes no rotation) into an svgpathtools Path."""
+
+    x, y, w, h = rect['left'], rect['top'], rect['width'], rect['height']
+    d = f"M {x},{y} L {x+w},{y} L {x+w},{y+h} L {x},{y+h} Z"
+
+    from svgpathtools import parse_path # off the hot path, only the reference needs it
+    return parse_path(d)
+
+def commands_to_path(commands):
+    """Convert a list-of-commands (e.g., [['M', 10, 20], ['L', 30, 40]]) into a Path."""
+
+    d = " ".join(cmd[0] + " " + " ".join(map(str, cmd[1:])) for cmd in commands)
+
+    from svgpathtools import parse_path
+    return parse_path(d)
+
+def path_intersects(path1, path2):
+    """Return True if any segment in path1 intersects any segment in path2."""
+
+    for seg1 in path1:
+        for seg2 in path2:
+            if seg1.intersect(seg2):
+                return True
+            
+    return False
+
+def circle_to_path(circle_obj):
+    """
+    Convert a circle dict into an svgpathtools Path.
+    Assumes the circle always has originX 'left' and originY 'center'.
+    The center is computed as (left + radius, top).
+    """
+
+    r = circle_obj['radius']
+    left = circle_obj['left']
+    top = circle_obj['top']
+    cx = left + r
+    cy = top
+
+    cx = circle_obj["left"] + circle_obj["radius"] * math.cos(circle_obj["angle"] * math.pi / 180)
+    cy = circle_obj["top"] + circle_obj["radius"] * math.sin(circle_obj["angle"] * math.pi / 180)
+    d = (
+        f"M {cx + r},{cy} "
+        f"A {r},{r} 0 1,0 {cx - r},{cy} "
+        f"A {r},{r} 0 1,0 {cx + r},{cy} Z"
+    )
+
+    from svgpathtools import parse_path
+    return parse_path(d)
+
+def has_point_inside(path, rect):
+    """
+    Check if any coordinate point in the commands list is inside the rectangle.
+    Assumes commands have coordinate pairs starting at index 1.
+    """
+
+    x0, y0 = rect['left'], rect['top']
+    x1, y1 = x0 + rect['width'], y0 + rect['height']
+
+    def check_single_point(px, py):
+        if x0 <= px <= x1 and y0 <= py <= y1:
+            return True
+        else:
+            return False
+
+    for t in path:
+        if t[0] in "ML":
+            if check_single_point(t[1], t[2]):
+                return True
+
+        elif t[0] == "Q":
+            if check_single_point(t[1], t[2]) or check_single_point(t[3], t[4]):
+                return True
+            
+    return False
+
+def circle_intersects_rect(circle_obj, rect):
+    """
+    Check if a circle intersects an axis-aligned rectangle.
+    Assumes the circle has originX 'left' and originY 'center', so its center is (left + radius, top).
+    """
+    r = circle_obj['radius']
+    cx = circle_obj['left'] + r
+    cy = circle_obj['top']
+    cx = circle_obj["left"] + circle_obj["radius"] * math.cos(circle_obj["angle"] * math.pi / 180)
+    cy = circle_obj["top"] + circle_obj["radius"] * math.sin(circle_obj["angle"] * math.pi / 180)
+    rx, ry = rect['left'], rect['top']
+    rw, rh = rect['width'], rect['height']
+    # Find the closest point on the rectangle to the circle's center
+    closest_x = max(rx, min(cx, rx + rw))
+    closest_y = max(ry, min(cy, ry + rh))
+    dist_sq = (cx - closest_x) ** 2 + (cy - closest_y) ** 2
+    return dist_sq < r * r
+
+def intersects_rect(obj, rect_obj, rect_path=None) -> bool:
+    """Whether an erasable object (path, line or circle) touches the rectangle."""
+
+    rect_path = rect_path or rect_to_path(rect_obj)
+
+    if obj["type"] == "path":
+        return has_point_inside(obj["path"], rect_obj) or path_intersects(commands_to_path(obj["path"]), rect_path)
+
+    elif obj["type"] == "line":
+        temp = [
+            ("M", obj["left"] + obj["x1"], obj["top"] + obj["y1"]),
+            ("L", obj["left"] + obj["x2"], obj["top"] + obj["y2"])
+        ]
+
+        return has_point_inside(temp, rect_obj) or path_intersects(commands_to_path(temp), rect_path)
+
+    elif obj["type"] == "circle":
+        return circle_intersects_rect(obj, rect_obj) or path_intersects(circle_to_path(obj), rect_path)
+
+    return False
+
+
+# vectorized kernel. every object is flattened once into numpy arrays:
+#   paths and lines -> quadratic segments (p0, p1, p2), straight ones with p1 at their midpoint,
+#                      plus the points has_point_inside looks at
+#   circles         -> center and radius
+# and a rectangle is tested against all of them in a few array operations.
+
+ERASABLE = ("path", "line", "circle")
+
+
+class Shape:
+    """Flattened geometry of an erasable canvas object."""
+
+    __slots__ = ("segments", "points", "circle", "box")
+
+    def __init__(self, segments: np.ndarray | None = None, points: np.ndarray | None = None, circle: tuple | None = None):
+        self.segments = segments # (n, 3, 2) control points
+        self.points = points # (m, 2)
+        self.circle = circle # (cx, cy, r)
+
+        if circle is not None:
+            cx, cy, r = circle
+            self.box = (cx - r, cy - r, cx + r, cy + r)
+        else:
+            # quadratic curves stay inside the box of their control points
+            every = np.concatenate([segments.reshape(-1, 2), points]) if len(segments) else points
+            x0, y0 = every.min(axis=0)
+            x1, y1 = every.max(axis=0)
+            self.box = (float(x0), float(y0), float(x1), float(y1))
+
+def flatten_commands(commands) -> Shape | None:
+    """Shape of a fabric path (M, L and Q commands), None if it uses anything else or has no points."""
+
+    segments = []
+    points = []
+    current = None
+
+    for command in commands:
+        match command[0]:
+            case "M":
+                current = (command[1], command[2])
+                points.append(current)
+
+            case "L":
+                if current is None:
+                    return None
+
+                end = (command[1], command[2])
+                segments.append((current, ((current[0] + end[0]) / 2, (current[1] + end[1]) / 2), end))
+                points.append(end)
+                current = end
+
+            case "Q":
+                if current is None:
+                    return None
+
+                control, end = (command[1], command[2]), (command[3], command[4])
+                segments.append((current, control, end))
+                points += [control, end]
+                current = end
+
+            case _:
+                return None
+
+    if not points:
+        return None
+
+    return Shape(np.array(segments, dtype=float).reshape(-1, 3, 2), np.array(points, dtype=float))
+
+def flatten(obj) -> Shape | None:
+    """Shape of an erasable object, None if the kernel can't handle it (the reference hit test has to)."""
+
+    if obj["type"] == "path":
+        return flatten_commands(obj["path"])
+
+    elif obj["type"] == "line":
+        return flatten_commands([
+            ("M", obj["left"] + obj["x1"], obj["top"] + obj["y1"]),
+            ("L", obj["left"] + obj["x2"], obj["top"] + obj["y2"])
+        ])
+
+    elif obj["type"] == "circle":
+        r = obj["radius"]
+        cx = obj["left"] + r * math.cos(obj["angle"] * math.pi / 180)
+        cy = obj["top"] + r * math.sin(obj["angle"] * math.pi / 180)
+        return Shape(circle=(cx, cy, r))
+
+    return None
+
+def crosses(segments: np.ndarray, axis: int, value: float, low: float, high: float) -> np.ndarray:
+    """
+    For each quadratic segment, whether it crosses the line {axis} = value somewhere with the other
+    coordinate in [low, high]. Solves the quadratic in t with the numerically stable formula.
+    """
+
+    other = 1 - axis
+    p0, p1, p2 = segments[:, 0], segments[:, 1], segments[:, 2]
+    a = p0[:, axis] - 2 * p1[:, axis] + p2[:, axis]
+    b = 2 * (p1[:, axis] - p0[:, axis])
+    c = p0[:, axis] - value
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        root = np.sqrt(b * b - 4 * a * c) # nan when there's no real solution
+        q = -0.5 * (b + np.where(b >= 0, 1, -1) * root)
+        hit = np.zeros(len(segments), dtype=bool)
+
+        for t in (q / a, c / q): # a == 0 (straight segments) leaves only c / q = -c / b
+            inside = (t >= 0) & (t <= 1)
+            s = 1 - t
+            position = s * s * p0[:, other] + 2 * s * t * p1[:, other] + t * t * p2[:, other]
+            hit |= inside & (position >= low) & (position <= high)
+
+    return hit
+
+def hits(shapes: list[Shape], rect_obj) -> np.ndarray:
+    """For each shape, whether the reference hit test would erase it with this rectangle."""
+
+    x0, y0 = rect_obj["left"], rect_obj["top"]
+    x1, y1 = x0 + rect_obj["width"], y0 + rect_obj["height"]
+    result = np.zeros(len(shapes), dtype=bool)
+
+    paths = [i for i, shape in enumerate(shapes) if shape.circle is None]
+    circles = [i for i, shape in enumerate(shapes) if shape.circle is not None]
+
+    if paths:
+        points = np.concatenate([shapes[i].points for i in paths])
+        point_owner = np.repeat(paths, [len(shapes[i].points) for i in paths])
+        inside = (points[:, 0] >= x0) & (points[:, 0] <= x1) & (points[:, 1] >= y0) & (points[:, 1] <= y1)
+        result[point_owner[inside]] = True
+
+        segments = np.concatenate([shapes[i].segments for i in paths])
+        segment_owner = np.repeat(paths, [len(shapes[i].segments) for i in paths])
+        crossing = (
+            crosses(segments, 0, x0, y0, y1) | crosses(segments, 0, x1, y0, y1) |
+            crosses(segments, 1, y0, x0, x1) | crosses(segments, 1, y1, x0, x1)
+        )
+        result[segment_owner[crossing]] = True
+
+    if circles:
+        cx, cy, r = np.array([shapes[i].circle for i in circles], dtype=float).T
+        closest_x = np.clip(cx, x0, x1)
+        closest_y = np.clip(cy, y0, y1)
+        result[circles] |= (cx - closest_x) ** 2 + (cy - closest_y) ** 2 < r * r
+
+    return result
+
+def erased(objects, rect_obj, shapes: list[Shape | None] | None = None) -> list[bool]:
+    """
+    Whether each object would be erased by the rectangle. shapes are their flattened geometry if it's
+    already known (None for objects the kernel can't handle), objects that aren't erasable never are.
+    """
+
+    if shapes is None:
+        shapes = [flatten(obj) if obj["type"] in ERASABLE else None for obj in objects]
+
+    fast = [i for i, shape in enumerate(shapes) if shape is not None]
+    result = [False] * len(objects)
+
+    for i, hit in zip(fast, hits([shapes[i] for i in fast], rect_obj)):
+        result[i] = bool(hit)
+
+    rect_path = None
+    for i, obj in enumerate(objects):
+        if shapes[i] is None and obj["type"] in ERASABLE: # unusual commands, the slow way
+            rect_path = rect_path or rect_to_path(rect_obj)
+            result[i] = intersects_rect(obj, rect_obj, rect_path)
+
+    return result
+
+
+# stroke simplification. fabric's pencil brush turns the points of a stroke (one per mouse event) into
+# quadratic curves through their midpoints, M p0, Q p0 mid(p0, p1), Q p1 mid(p1, p2), ..., L pn.
+# the curve is sampled (both ends and the middle of each segment) and Ramer-Douglas-Peucker keeps the
+# fewest samples whose polyline stays within the tolerance of all of them. each pass splits every
+# interval that's still too far off at once.
+
+def simplify_points(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """Mask of the points (n, 2) Ramer-Douglas-Peucker keeps, the first and last always are."""
+
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+
+    if n < 3:
+        return keep
+
+    positions = np.arange(n)
+
+    while True:
+        kept = np.flatnonzero(keep)
+        interval = np.minimum(np.searchsorted(kept, positions, side="right") - 1, len(kept) - 2)
+        a, b = points[kept[interval]], points[kept[interval + 1]]
+
+        # distance to the segment between the kept points around each point
+        ab = b - a
+        length = (ab * ab).sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.clip(((points - a) * ab).sum(axis=1) / length, 0, 1)
+        t[length == 0] = 0
+        distance = np.hypot(*(a + t[:, None] * ab - points).T)
+        distance[keep] = 0
+
+        # the farthest point of every interval, if it's too far
+        farthest = np.maximum.reduceat(distance, kept[:-1])
+        split = (distance == farthest[interval]) & (distance > tolerance)
+
+        if not split.any():
+            return keep
+
+        first = np.unique(interval[split], return_index=True)[1] # one per interval
+        keep[positions[split][first]] = True
+
+def simplify_commands(commands, tolerance: float) -> list | None:
+    """
+    A stroke (M then L and Q commands) as M and L commands within about tolerance of its curve
+    (the middle of a segment is sampled, the rest of it can stray |p0 - 2 p1 + p2| / 16 further).
+    None if it's any other path, or it wouldn't get shorter.
+    """
+
+    if not commands or commands[0][0] != "M" or any(command[0] not in ("L", "Q") for command in commands[1:]):
+        return None
+
+    shape = flatten_commands(commands)
+    if shape is None or len(shape.segments) < 2:
+        return None
+
+    p0, p1, p2 = shape.segments[:, 0], shape.segments[:, 1], shape.segments[:, 2]
+    middles = (p0 + 2 * p1 + p2) / 4
+    samples = np.concatenate([np.stack([p0, middles], axis=1).reshape(-1, 2), p2[-1:]])
+
+    kept = samples[simplify_points(samples, tolerance)]
+    if len(kept) - 1 >= len(commands) - 1:
+        return None
+
+    return [["M", *kept[0].tolist()]] + [["L", *point.tolist()] for point in kept[1:]]
+
+
+def check_kernel(trials: int = 200, seed: int = 0) -> int:
+    """
+    Property check: random strokes, lines, circles and eraser rectangles must get the same
+    erase decisions from the kernel and from the reference hit tests. Returns the mismatches.
+    """
+
+    rng = random.Random(seed)
+    mismatches = 0
+
+    def random_object():
+        x, y = rng.uniform(0, 600), rng.uniform(0, 400)
+
+        match rng.choice(ERASABLE):
+            case "path":
+                commands = [["M", x, y]]
+                for _ in range(rng.randint(0, 30)):
+                    cx, cy = x + rng.uniform(-15, 15), y + rng.uniform(-15, 15)
+                    x, y = cx + rng.uniform(-15, 15), cy + rng.uniform(-15, 15)
+                    commands.append(["Q", cx, cy, x, y])
+                commands.append(["L", x + rng.uniform(-15, 15), y + rng.uniform(-15, 15)])
+                return {"type": "path", "path": commands}
+
+            case "line":
+                return {"type": "line", "left": x, "top": y, "x1": rng.uniform(-80, 80), "y1": rng.uniform(-80, 80),
+                    "x2": rng.uniform(-80, 80), "y2": rng.uniform(-80, 80)}
+
+            case "circle":
+                return {"type": "circle", "left": x, "top": y, "radius": rng.uniform(1, 80), "angle": rng.uniform(0, 360)}
+
+    for _ in range(trials):
+        objects = [random_object() for _ in range(rng.randint(1, 20))]
+        rect = {"type": "rect", "left": rng.uniform(0, 580), "top": rng.uniform(0, 380),
+            "width": rng.uniform(1, 120), "height": rng.uniform(1, 120)}
+
+        rect_path = rect_to_path(rect)
+        expected = [intersects_rect(obj, rect, rect_path) for obj in objects]
+        mismatches += sum(a != b for a, b in zip(expected, erased(objects, rect)))
+
+    return mismatches
+
+
+def check_simplify(tolerance: float = 0.5, trials: int = 200, seed: int = 0) -> float:
+    """
+    Property check: random pencil strokes, simplified, must stay within about tolerance of the original.
+    Both curves are sampled, returns the farthest an original sample is from the simplified ones.
+    """
+
+    rng = np.random.default_rng(seed)
+    worst = 0.0
+
+    def samples(commands) -> np.ndarray:
+        segments = flatten_commands(commands).segments
+        t = np.linspace(0, 1, 8)[:, None, None]
+        curve = (1 - t) ** 2 * segments[:, 0] + 2 * (1 - t) * t * segments[:, 1] + t * t * segments[:, 2]
+        return curve.transpose(1, 0, 2).reshape(-1, 2) # segment by segment
+
+    for _ in range(trials):
+        # a mouse wandering at a few pixels per event, on whole pixels
+        n = rng.integers(3, 300)
+        heading = rng.uniform(0, 2 * np.pi) + rng.normal(0, 0.1, n).cumsum()
+        speed = np.clip(2 + rng.normal(0, 0.3, n).cumsum(), 0.5, 6)
+        points = np.round(rng.uniform(100, 300, 2) + (np.stack([np.cos(heading), np.sin(heading)], axis=1) * speed[:, None]).cumsum(axis=0))
+        middles = (points[:-1] + points[1:]) / 2
+        commands = [["M", *points[0]]] + [["Q", *c, *m] for c, m in zip(points[:-1], middles)] + [["L", *points[-1]]]
+
+        simplified = simplify_commands(commands, tolerance)
+        if simplified is None:
+            continue
+
+        original, simple = samples(commands), samples(simplified)
+        # distance to the simplified curve, as its samples joined by segments
+        a, b = simple[:-1], simple[1:]
+        ab = b - a
+        length = np.maximum((ab * ab).sum(axis=1), 1e-12)
+        t = np.clip(((original[:, None] - a) * ab).sum(axis=2) / length, 0, 1)
+        distance = np.hypot(*(a + t[..., None] * ab - original[:, None]).transpose(2, 0, 1)).min(axis=1)
+        worst = max(worst, float(distance.max()))
+
+    return worst
+
+
+if __name__ == "__main__":
+    print(f"kernel vs reference mismatches: {check_kernel()}")
+    print(f"simplified strokes, farthest from the original: {check_simplify():.3f}px (tolerance 0.5px)")
@@ -0,0 +1,123 @@
+import streamlit as st
+from sconfig import SECRETS
+
+
+MAX_BYTES = int(SECRETS.get("history_mb", 32) * 1024 * 1024) # `history_mb` in secrets.toml, oldest steps are dropped first
+
+
+class Delta:
+    """
+    A reversible change. Subclasses keep just enough to go both ways (never a copy of the notebook),
+    so undoing or redoing a step costs as much as the change itself.
+    key names what was changed, a delta recorded with follow=key joins the step that changed it.
+    """
+
+    key: str | None = None
+
+    def undo(self) -> None:
+        raise NotImplementedError
+
+    def redo(self) -> None:
+        raise NotImplementedError
+
+    def nbytes(self) -> int:
+        """Rough memory this delta keeps alive, for the history budget."""
+
+        return 0
+
+
+class Step(list):
+    """The deltas of one undo step. nbytes is what they held when they were recorded, it's what's given back when it's dropped."""
+
+    nbytes = 0
+
+
+class App:
+    """Per session undo/redo history. Deltas recorded during the same script run form one step."""
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.undo_steps: list[Step] = []
+        self.redo_steps: list[Step] = []
+        self.open = False # whether the last undo step still takes deltas
+        self.nbytes = 0 # held by both stacks
+        self.applying = False # set while undoing/redoing, so the changes it makes aren't recorded again
+
+    def clear(self) -> None:
+        self.__init__(self.max_bytes)
+
+    def seal(self) -> None:
+        """Ends the current step, the next delta starts a new one."""
+
+        self.open = False
+
+    def record(self, delta: Delta, follow: str | None = None) -> None:
+        """
+        Adds delta to the current step. With follow, it joins the last step instead if that one ended
+        with a change to follow (the canvas pixels catching up with its strokes a rerun later).
+        """
+
+        if self.applying:
+            return
+
+        joins = follow is not None and self.undo_steps and self.undo_steps[-1][-1].key == follow
+
+        if not (self.open or joins) or not self.undo_steps:
+            self.undo_steps.append(Step())
+            self.open = True
+
+        # sized once, what it holds may be spilled or shared later, the total mustn't drift from what was added
+        nbytes = delta.nbytes()
+        self.undo_steps[-1].append(delta)
+        self.undo_steps[-1].nbytes += nbytes
+        self.nbytes += nbytes
+
+        for step in self.redo_steps: # a new change ends the redo chain
+            self.nbytes -= step.nbytes
+        self.redo_steps.clear()
+
+        # drop the oldest steps first, never the one being recorded
+        while self.nbytes > self.max_bytes and len(self.undo_steps) > 1:
+            self.nbytes -= self.undo_steps.pop(0).nbytes
+
+    def can_undo(self) -> bool:
+        return bool(self.undo_steps)
+
+    def can_redo(self) -> bool:
+        return bool(self.redo_steps)
+
+    def undo(self) -> None:
+        if not self.undo_steps:
+            return
+
+        step = self.undo_steps.pop()
+        self.apply(reversed(step), "undo")
+        self.redo_steps.append(step)
+        self.open = False
+
+    def redo(self) -> None:
+        if not self.redo_steps:
+            return
+
+        step = self.redo_steps.pop()
+        self.apply(step, "redo")
+        self.undo_steps.append(step)
+        self.open = False
+
+    def apply(self, deltas, direction: str) -> None:
+        self.applying = True
+
+        try:
+            for delta in deltas:
+                getattr(delta, direction)()
+        finally:
+            self.applying = False
+
+def get_app() -> App:
+    if not "history" in st.session_state:
+        st.session_state.history = App()
+
+    return st.session_state.history
+
+def record(delta: Delta, follow: str | None = None) -> None:
+    get_app().record(delta, follow)
@@ -0,0 +1,154 @@
+from collections import OrderedDict
+from threading import Lock
+from PIL import Image
+import numpy as np
+import hashlib
+import json
+import io
+
+
+CACHE_SIZE = 16 # decoded arrays kept around, shared by every session
+_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_cache_lock = Lock()
+
+
+class CompactImage:
+    """
+    Content of an image block. Only the bounding box of the non transparent pixels is stored, png compressed.
+    The full size RGBA array is decoded on demand and kept in a small LRU cache.
+    data is the png bytes, or anything with a read() returning them (a payload that hasn't been loaded yet).
+    vectors is the same drawing as canvas objects (see svectors), json encoded the same way, None if it's only pixels.
+    """
+
+    def __init__(self, shape: tuple[int, int], bbox: tuple[int, int, int, int] | None, data, vectors=None):
+        self.shape = tuple(shape) # (height, width)
+        self.bbox = tuple(bbox) if bbox is not None else None # (top, left, bottom, right), None if it's blank
+        self.data = data
+        self.vectors = vectors
+        self._digest = None
+
+    @classmethod
+    def from_array(cls, array: np.ndarray, objects: list | None = None) -> "CompactImage":
+        array = np.asarray(array, dtype=np.uint8)
+        rows = np.flatnonzero(array[..., 3].any(axis=1))
+        cols = np.flatnonzero(array[..., 3].any(axis=0))
+
+        if not rows.size:
+            return cls(array.shape[:2], None, None)
+
+        bbox = (int(rows[0]), int(cols[0]), int(rows[-1]) + 1, int(cols[-1]) + 1)
+        crop = array[bbox[0]:bbox[2], bbox[1]:bbox[3]]
+
+        buffer = io.BytesIO()
+        Image.fromarray(np.ascontiguousarray(crop)).save(buffer, "PNG", compress_level=1)
+        vectors = json.dumps(objects, separators=(",", ":")).encode() if objects is not None else None
+        image = cls(array.shape[:2], bbox, buffer.getvalue(), vectors)
+
+        image._remember(image._paste(crop)) # it's about to be rendered, don't decode it again
+        return image
+
+    @classmethod
+    def blank(cls, width: int, height: int) -> "CompactImage":
+        return cls((height, width), None, None)
+
+    def png(self) -> bytes | None:
+        """Compressed bytes of the cropped region, None for a blank image."""
+
+        if self.data is not None and not isinstance(self.data, bytes):
+            return self.data.read() # not kept, the payload stays on disk until the block is saved again
+
+        return self.data
+
+    def vector_json(self) -> bytes | None:
+        if self.vectors is not None and not isinstance(self.vectors, bytes):
+            return self.vectors.read()
+
+        return self.vectors
+
+    def objects(self) -> list | None:
+        """The canvas objects it was drawn with, None if they weren't kept."""
+
+        data = self.vector_json()
+        return json.loads(data) if data is not None else None
+
+    def digest(self) -> str:
+        """Content hash, equal images have equal digests."""
+
+        if self._digest is None:
+            h = hashlib.sha1(repr((self.shape, self.bbox)).encode())
+            h.update(self.png() or b"")
+
+            if self.vectors is not None: # images that are only pixels keep the digest they always had
+                h.update(self.vector_json())
+            self._digest = h.hexdigest()
+
+        return self._digest
+
+    def array(self) -> np.ndarray:
+        """Full size RGBA array. Read only, it may be shared with other blocks and sessions."""
+
+        digest = self.digest()
+
+        with _cache_lock:
+            if digest in _cache:
+                _cache.move_to_end(digest)
+                return _cache[digest]
+
+        return self._remember(self._paste(self.crop() if self.bbox is not None else None))
+
+    def crop(self) -> np.ndarray:
+        """Freshly decoded (writable) array of the bounding box region. Not for blank images."""
+
+        return np.array(Image.open(io.BytesIO(self.png())).convert("RGBA"))
+
+    def spill(self, write) -> None:
+        """
+        Moves the bytes it holds out of memory, write(bytes) stores them and returns something with a read().
+        It reads them back from there when they're needed, like a payload that hasn't been loaded.
+        """
+
+        digest = self.digest() # it's compared against a lot, keep it
+
+        if isinstance(self.data, bytes):
+            self.data = write(self.data)
+        if isinstance(self.vectors, bytes):
+            self.vectors = write(self.vectors)
+
+        self._digest = digest
+
+    def load(self, kind: type) -> None:
+        """The opposite of spill, the parts that are a kind (of payload) are read back into memory."""
+
+        digest = self.digest()
+
+        if isinstance(self.data, kind):
+            self.data = self.data.read()
+        if isinstance(self.vectors, kind):
+            self.vectors = self.vectors.read()
+
+        self._digest = digest
+
+    def nbytes(self) -> int:
+        return sum(len(part) for part in (self.data, self.vectors) if isinstance(part, bytes))
+
+    def _paste(self, crop: np.ndarray | None) -> np.ndarray:
+        array = np.zeros((*self.shape, 4), dtype=np.uint8)
+
+        if crop is not None:
+            top, left, bottom, right = self.bbox
+            array[top:bottom, left:right] = crop
+
+        array.flags.writeable = False
+        return array
+
+    def _remember(self, array: np.ndarray) -> np.ndarray:
+        digest = self.digest()
+
+        with _cache_lock:
+            _cache[digest] = array
+            _cache.move_to_end(digest)
+
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+
+        return array
@@ -0,0 +1,125 @@
+from types import ModuleType, FunctionType, MethodType
+from os.path import join
+from collections import deque
+from typing import Callable, Hashable
+from sconfig import SECRETS
+from weakref import finalize
+import streamlit as st
+import tempfile
+import shutil
+import uuid
+import sys
+import os
+
+
+# per session memory accounting. what a session holds (drawings, canvas states, the undo history)
+# is added up after every full rerun, once it's over the budget the drawings and canvases that
+# were used least recently are written to a scratch directory and read back when they're needed.
+# each session has its own directory, removed with the session (or when the server exits).
+
+BUDGET = int(SECRETS.get("session_memory_mb", 64) * 1024 * 1024) # `session_memory_mb` in secrets.toml
+SCRATCH_DIR = SECRETS.get("scratch_dir", join(tempfile.gettempdir(), "snotes-scratch"))
+
+Candidate = tuple[Hashable, int, Callable[[], None]] # (key, bytes, spill), keys are what touch() was given
+
+
+def remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class ScratchPayload:
+    """Bytes moved to the scratch directory, read back on demand (like sstorage.LazyPayload). The file goes with it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        finalize(self, remove, path)
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+class App:
+    def __init__(self, budget: int = BUDGET):
+        self.budget = budget
+        self.directory = join(SCRATCH_DIR, uuid.uuid4().hex)
+        self.run = 0 # full reruns so far
+        self.touched: dict[Hashable, int] = {} # key (a block id) -> run it was last used in
+        self.usage: dict[str, int] = {} # bytes per kind of structure, after the last rerun
+        self.spills = 0
+        self.spilled_bytes = 0
+
+        finalize(self, shutil.rmtree, self.directory, True) # the session is gone
+
+    def write(self, data: bytes) -> ScratchPayload:
+        os.makedirs(self.directory, exist_ok=True)
+        path = join(self.directory, uuid.uuid4().hex) # older versions may still be in the undo history
+
+        with open(path, "wb") as f:
+            f.write(data)
+
+        return ScratchPayload(path)
+
+    def used(self) -> int:
+        return sum(self.usage.values())
+
+    def touch(self, key: Hashable) -> None:
+        self.touched[key] = self.run
+
+    def enforce(self, usage: dict[str, int], candidates: list[Candidate]) -> None:
+        """Records usage, then spills the least recently used candidates until it's within the budget."""
+
+        self.usage = usage
+        used = self.used()
+
+        for key, size, spill in sorted(candidates, key=lambda candidate: self.touched.get(candidate[0], -1)):
+            if used <= self.budget:
+                break
+
+            spill()
+            used -= size
+            self.spills += 1
+            self.spilled_bytes += size
+
+        self.run += 1
+
+
+def deep_size(obj, seen: set[int] | None = None) -> int:
+    """Rough memory held by obj and everything it references, objects already in seen are skipped."""
+
+    seen = set() if seen is None else seen
+    stack = [obj]
+    size = 0
+
+    while stack:
+        obj = stack.pop()
+
+        if id(obj) in seen or isinstance(obj, (type, ModuleType, FunctionType, MethodType)):
+            continue
+
+        seen.add(id(obj))
+        size += sys.getsizeof(obj) # numpy arrays and bytes include their data
+
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            stack.extend(obj)
+        elif hasattr(obj, "__dict__"):
+            stack.append(vars(obj))
+        elif hasattr(obj, "__slots__"):
+            stack.extend(getattr(obj, name) for name in obj.__slots__ if hasattr(obj, name))
+
+    return size
+
+def get_app() -> App:
+    if not "memory" in st.session_state:
+        st.session_state.memory = App()
+
+    return st.session_state.memory
+
+def touch(key: Hashable) -> None:
+    get_app().touch(key)
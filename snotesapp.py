@@ -1,23 +1,12 @@
 #* SNotesApp
 
-from os.path import exists
 import streamlit as st
-import tomli
+from sconfig import SECRETS
 
 
-# this has to go before imports because imports use secrets.toml
-DEFAULT_SECRETS = """
-author = "Anonymous"
-data_dir = "./data/"
-months_language = "en" # supported: "en", "es"
-"""
-
-if not exists("./secret.toml"):
-    with open("./secrets.toml", "w") as f:
-        f.write(DEFAULT_SECRETS)
-
-SECRETS = tomli.load(open("./secrets.toml", "rb"))
 SAVE_EVERY = 60 * 5 # in seconds, set to 5 minutes
+STATUS_EVERY = 2 # in seconds, how often the status line (and the autosave timer) refreshes
+PAGE_SIZE = 30 # blocks rendered at once, longer notes are shown a page at a time
 
 st.set_page_config(
     layout="centered", # centered is optional.
@@ -27,29 +16,37 @@ st.set_page_config(
 )
 
 
-import streamlit_extras.row as st_r
 from copy import deepcopy as copy
 from typing import Literal, Any
-import code_editor as st_ce
 from random import randint
 import sprinting as st_p
+import sstorage as st_s
+import simages as st_i
+import svectors as st_vx
+import ssaving as st_sv
 import scanvas as st_cv
-from os import listdir
-from PIL import Image
+import shistory as st_h
+import ssearch as st_se
+import scatalog as st_c
+import sversions as st_v
+import sprofiler as st_pf
+import smemory as st_m
+from datetime import datetime
 import numpy
 import time
-import dill
 import re
 
 
 global_editing = True #? keep this in the app itself? idk
+HEADING = re.compile(r" {0,3}(#{1,6})\s+(.*?)#*\s*$")
 
 
 
 def restart_app_singleton() -> None:
     st.session_state.app = App()
     st.session_state.app.block_id = 0
-    st.session_state.app.blocks.append(Block("title", "Insert title"))
+    st.session_state.app.set_blocks([Block("title", "Insert title")])
+    st_h.get_app().clear() # the history belongs to the notes it was recorded on
 
 def get_app() -> "App":
     # note: cant be used for setting
@@ -58,26 +55,137 @@ def get_app() -> "App":
 
 class App:
     def __init__(self):
-        self.blocks: list["Block"] = []
+        self.blocks: list["Block"] = [] # only changed through the methods below, they keep the indexes in sync
+        self.by_id: dict[int, "Block"] = {}
+        self.positions: dict[int, int] | None = {} # id -> index in blocks, None when it has to be rebuilt
         self.block_id = 0
         self.name = "new_notes_" + str(randint(100000, 999999)) + ".notes" # if this overwrites you, you're cooked
         self.saved = False
         self.last_saved = None
+        self.file = None # file the blocks were last saved to or opened from, saves to it only journal changes
+        self.rerun_requested = False # a block changed more than itself (see notes_changed)
+        self.focus = 0 # index of the block the page is around (see visible_range)
 
     def collapse_block_editing(self) -> None:
         # for each block, set their inner editing variable to False
         for block in self.blocks:
             block.editing = False
 
-    def delete_block_by_id(self, id: int) -> None:
-        index = -1
+    def request_rerun(self) -> None:
+        """
+        Blocks rerun on their own, this asks for the whole app to rerun after the current block does
+        (the block list changed, or something the sidebar shows did). Works from callbacks too.
+        """
+
+        self.rerun_requested = True
+
+    def notes_changed(self) -> None:
+        """Event for any change to the notes: they're unsaved now, and a compiled pdf (shown in the sidebar) is stale."""
+
+        self.saved = False # the status line picks this up on its own timer
+
+        if "printing" in st.session_state and (st_p.get_app().compiled is not None or st_p.get_app().job is not None):
+            st_p.set_uncompiled()
+            self.request_rerun()
+
+    def set_blocks(self, blocks: list["Block"], block_id: int | None = None) -> None:
+        """Replaces every block (new or opened notes). block_id is the next id to hand out."""
+
+        if block_id is not None:
+            self.block_id = block_id
+
+        # never hand out an id that's already taken, whatever the file said
+        self.block_id = max([self.block_id] + [block.id + 1 for block in blocks])
+
+        self.blocks = blocks
+        self.by_id = {}
+        self.positions = None
+
+        for block in blocks:
+            if block.id in self.by_id: # a broken older file, the index needs them unique
+                block.id = self.get_new_block_id()
+                block.dirty = True
+
+            self.by_id[block.id] = block
+
+    def get_block(self, id: int) -> "Block":
+        return self.by_id[id]
+
+    def position(self, id: int) -> int:
+        """Index of a block. A change to the order rebuilds the index once, on the next lookup."""
+
+        if self.positions is None:
+            self.positions = {block.id: i for i, block in enumerate(self.blocks)}
+
+        return self.positions[id]
+
+    def place(self, index: int, block: "Block") -> None:
+        """Puts a block in the list, without recording it (see insert_block)."""
+
+        self.blocks.insert(index, block)
+        self.by_id[block.id] = block
+
+        if self.positions is not None and index >= len(self.blocks) - 1: # appended, nothing else moved
+            self.positions[block.id] = len(self.blocks) - 1
+        else:
+            self.positions = None
 
-        for i, block in enumerate(self.blocks):
-            if block.id == id:
-                index = i
+    def unplace(self, block: "Block") -> int:
+        """Takes a block out of the list, without recording it. Returns where it was."""
 
-        assert index != -1
+        index = self.position(block.id)
         self.blocks.pop(index)
+        del self.by_id[block.id]
+
+        if index == len(self.blocks): # it was the last one, nothing else moved
+            del self.positions[block.id]
+        else:
+            self.positions = None
+
+        return index
+
+    def delete_block_by_id(self, id: int) -> None:
+        block = self.get_block(id)
+        st_h.record(BlockDelete(self.unplace(block), block))
+        self.notes_changed()
+        self.request_rerun()
+
+    def move_block(self, id: int, index: int) -> None:
+        block = self.get_block(id)
+        old_index = self.unplace(block)
+        self.place(index, block)
+        self.show_block(index)
+        st_h.record(BlockMove(block, old_index, index))
+        self.notes_changed()
+        self.request_rerun()
+
+    def insert_block(self, index: int, block: "Block") -> None:
+        self.place(index, block)
+        self.show_block(index)
+        st_h.record(BlockInsert(index, block))
+        self.notes_changed()
+        self.request_rerun()
+
+    def visible_range(self) -> tuple[int, int]:
+        """Indexes of the blocks on the page, [start, end). A focused block is shown with a few of the ones before it."""
+
+        if len(self.blocks) <= PAGE_SIZE:
+            return 0, len(self.blocks)
+
+        start = min(max(self.focus - PAGE_SIZE // 5, 0), len(self.blocks) - PAGE_SIZE)
+        return start, start + PAGE_SIZE
+
+    def show_block(self, index: int) -> None:
+        """Moves the page to index, unless it's already on it."""
+
+        start, end = self.visible_range()
+        if not start <= index < end:
+            self.focus = index
+
+    def outline(self) -> list[tuple[int, int, str]]:
+        """(block index, level, text) of the title and of every markdown heading, in order."""
+
+        return [(i, level, text) for i, block in enumerate(self.blocks) for level, text in block.headings()]
 
     def get_new_block_id(self) -> int:
         self.block_id += 1
@@ -88,26 +196,79 @@ class App:
         assert self.blocks[0].type == "title"
         return self.blocks[0].content
     
-    def make_printable(self) -> list[str | Image.Image]:
-        return [block.content for block in self.blocks[1:]] # todo rerank headers, add replacements ("->")
+    def make_printable(self) -> list[str | st_i.CompactImage]:
+        return st_p.make_printable([(block.id, block.type, block.content) for block in self.blocks])[1] # todo rerank headers, add replacements ("->")
     
     def name_is_new(self) -> bool:
         return re.match(r"new_notes_([123456789]+)\.notes", self.name)
     
 
 class Block:
-    def __init__(self, type: Literal["text", "image"], content: Any) -> None:
+    def __init__(self, type: Literal["text", "image"], content: Any, id: int | None = None) -> None:
         self.type = type
-        self.content = content
+        self._content = content
         self.editing = False
-        self.id = get_app().get_new_block_id()
+        self.canvas_data = None # last pixels the canvas returned while editing, not saved
+        self.dirty = id is None # changed since the last save, loaded blocks start clean
+        self._headings = (None, []) # (content they were read from, headings)
+        self.id = get_app().get_new_block_id() if id is None else id # loaded blocks keep their id
 
         assert type in ["title", "text", "image"]
 
+    @property
+    def content(self) -> Any:
+        if self.type == "image" and not isinstance(self._content, st_i.CompactImage | None):
+            self._content = st_s.compact(self._content) # stored by an older version
+
+        return self._content
+
+    @content.setter
+    def content(self, value: Any) -> None:
+        self.edit(value)
+
+    def edit(self, value: Any, follow: str | None = None) -> None:
+        """Sets the content, recording the change for undo. follow is passed on to the history (see shistory)."""
+
+        if value is self._content or (isinstance(value, str) and value == self._content):
+            return # widgets hand back the same text on every rerun
+
+        st_h.record(BlockEdit(self, self.content, value), follow)
+        self._content = value
+        self.dirty = True
+        get_app().notes_changed()
+
+    def headings(self) -> list[tuple[int, str]]:
+        """(level, text) of the headings in this block, the title being level 0. Only reparsed when the text changes."""
+
+        if self.type == "image":
+            return []
+
+        if self._headings[0] is not self._content:
+            if self.type == "title":
+                headings = [(0, self._content)]
+            else:
+                headings = []
+                fenced = False
+
+                for line in self._content.splitlines():
+                    if line.lstrip().startswith("```"):
+                        fenced = not fenced
+                    elif not fenced and (match := HEADING.match(line)):
+                        headings.append((len(match[1]), match[2].strip()))
+
+            self._headings = (self._content, headings)
+
+        return self._headings[1]
+
+    def record(self) -> st_s.Record:
+        return (self.id, self.type, self._content) # doesn't load lazy payloads
+
     def activate_editing(self) -> None:
+        if any(block.editing for block in get_app().blocks):
+            get_app().request_rerun() # that block has to close its editor
+
         get_app().collapse_block_editing() # used to ensure only 1 editing block is active at a time.
-        get_app().saved = False
-        st_p.set_uncompiled()
+        get_app().notes_changed()
         self.editing = True
 
         if self.type == "image":
@@ -115,6 +276,7 @@ class Block:
 
     def save_edits(self) -> None:
         self.editing = False
+        self.canvas_data = None
 
     def delete_block(self) -> None:
         get_app().delete_block_by_id(self.id) # commits suicide
@@ -125,6 +287,8 @@ class Block:
     def render_text_gediting(self, column):
         if self.editing:
             with column:
+                import code_editor as st_ce # loaded with the first text edit
+
                 buffer = st_ce.code_editor(
                     self.content,
                     lang="markdown",
@@ -160,29 +324,60 @@ class Block:
 
     def render_image_normal(self):
         if self.content is not None:
-            st.image(self.content)
+            st.image(self.content.array())
 
     def render_image_gediting(self, column): #? can this be centered?
         with column:
             if self.editing:
                 canvas_result = st_cv.canvas(
                     width=500,
-                    key=f"canvas_{self.id}"
+                    key=f"canvas_{self.id}",
+                    rerun_scope="fragment" # the block's
                 )
 
+                # the canvas hands back its pixels on every rerun, only compress them when they changed
                 if canvas_result.image_data is not None:
-                    self.content = canvas_result.image_data
+                    if self.canvas_data is None or not numpy.array_equal(self.canvas_data, canvas_result.image_data):
+                        self.canvas_data = canvas_result.image_data
+                        # the strokes go along, pdfs draw them as vectors instead of these pixels
+                        objects = st_vx.compact(st_cv.get_app(f"canvas_{self.id}").buffer.objects)
+                        image = st_i.CompactImage.from_array(canvas_result.image_data, objects)
+
+                        # a remounted canvas redraws what's already there
+                        if self.content is None or image.digest() != self.content.digest():
+                            self.edit(image, follow=f"canvas_{self.id}") # same undo step as the strokes
 
             else:
                 self.render_image_normal()
 
+    @st.fragment
     def render(self, global_editing: bool) -> None:
+        """
+        Each block is a fragment, so editing it only reruns the block. Changes that reach further
+        go through App.notes_changed and App.request_rerun.
+        """
+
+        if get_app().rerun_requested: # asked for by a callback of this block
+            get_app().rerun_requested = False
+            st.rerun()
+
+        with st_pf.rerun("fragment"), st_pf.timed("block.render"):
+            st_h.get_app().seal() # what this run changes is one undo step
+            self.render_contents(global_editing)
+            st_h.get_app().seal()
+
+        if get_app().rerun_requested:
+            get_app().rerun_requested = False
+            st.rerun()
+
+    def render_contents(self, global_editing: bool) -> None:
+        st_m.touch(self.id) # the least recently shown blocks are the first to be moved to disk
+
         with st.container(border=(self.type != "title")):
             if global_editing:
                 if self.type == "title":
                     def on_change():
-                        get_app().saved = False
-                        st_p.set_uncompiled()
+                        get_app().request_rerun() # the pdf is named after it
 
                     self.content = st.text_input("Title", self.content, on_change=on_change, key="TITLE")
                     return
@@ -207,7 +402,7 @@ class Block:
                     st.button("", icon=":material/delete:", help="Delete this block",
                         on_click=self.delete_block, key=f"del_{self.id}")
                     st.button("", icon=":material/library_add:", help="Add new block after this one",
-                        on_click=add_block, args=(get_app().blocks.index(self) + 1,), key=f"add_{self.id}")
+                        on_click=add_block, args=(get_app().position(self.id) + 1,), key=f"add_{self.id}")
 
             else:
                 match self.type:
@@ -223,13 +418,207 @@ class Block:
                         self.render_image_normal()
 
 
+class BlockInsert(st_h.Delta):
+    def __init__(self, index: int, block: Block):
+        self.index = index
+        self.block = block
+        owned(block.content)
+
+    def undo(self) -> None:
+        get_app().unplace(self.block)
+
+    def redo(self) -> None:
+        get_app().place(self.index, self.block)
+        self.block.dirty = True # it may have been left out of the last save
+
+    def nbytes(self) -> int:
+        return content_nbytes(self.block.content)
+
+class BlockDelete(BlockInsert):
+    def undo(self) -> None:
+        super().redo()
+
+    def redo(self) -> None:
+        super().undo()
+
+class BlockMove(st_h.Delta):
+    def __init__(self, block: Block, old_index: int, new_index: int):
+        self.block = block
+        self.old_index = old_index
+        self.new_index = new_index
+
+    def undo(self) -> None:
+        get_app().unplace(self.block)
+        get_app().place(self.old_index, self.block)
+
+    def redo(self) -> None:
+        get_app().unplace(self.block)
+        get_app().place(self.new_index, self.block)
+
+class BlockEdit(st_h.Delta):
+    """
+    A content change. Text keeps only the part that changed (the common prefix and suffix are cut off),
+    images keep both versions, they're immutable and compressed.
+    """
+
+    def __init__(self, block: Block, old: Any, new: Any):
+        self.block = block
+
+        if isinstance(old, str) and isinstance(new, str):
+            start = common_prefix(old, new)
+            end = common_prefix(old[start:][::-1], new[start:][::-1])
+
+            self.start = start
+            self.old = old[start:len(old) - end]
+            self.new = new[start:len(new) - end]
+        else:
+            self.start = None
+            self.old = owned(old)
+            self.new = owned(new)
+
+    def replace(self, current: Any, part: Any, by: Any) -> Any:
+        if self.start is None:
+            return by
+
+        return current[:self.start] + by + current[self.start + len(part):]
+
+    def set(self, value: Any) -> None:
+        self.block._content = value
+        self.block.dirty = True
+
+        if self.block.type == "title":
+            st.session_state.pop("TITLE", None) # the text input would hand back the newer title otherwise
+
+    def undo(self) -> None:
+        self.set(self.replace(self.block.content, self.new, self.old))
+
+    def redo(self) -> None:
+        self.set(self.replace(self.block.content, self.old, self.new))
+
+    def nbytes(self) -> int:
+        return content_nbytes(self.old) + content_nbytes(self.new)
+
+def common_prefix(a: str, b: str, chunk: int = 4096) -> int:
+    """Length of the common prefix. Compared a chunk at a time (slices compare in C), then halving the chunk that differs."""
+
+    length = min(len(a), len(b))
+    start = 0
+
+    while start < length:
+        end = min(start + chunk, length)
+        if a[start:end] == b[start:end]:
+            start = end
+            continue
+
+        while end - start > 1: # a[:start] is common, a[:end] isn't
+            middle = (start + end) // 2
+            if a[start:middle] == b[start:middle]:
+                start = middle
+            else:
+                end = middle
+
+        return start
+
+    return length
+
+def owned(content: Any) -> Any:
+    """
+    Content the history can keep. Image payloads still in the notes file are read into memory,
+    a full save (a compaction, a restore) overwrites or drops what they point at, and only rebinds the live blocks.
+    """
+
+    if isinstance(content, st_i.CompactImage):
+        content.load(st_s.LazyPayload)
+
+    return content
+
+def content_nbytes(content: Any) -> int:
+    if isinstance(content, str):
+        return len(content)
+
+    if isinstance(content, st_i.CompactImage):
+        return content.nbytes()
+
+    return 0
+
+def undo() -> None:
+    get_app().collapse_block_editing() # an open editor would hand back what it's showing
+    st_h.get_app().undo()
+    get_app().saved = False
+    st_p.set_uncompiled()
+
+def redo() -> None:
+    get_app().collapse_block_editing()
+    st_h.get_app().redo()
+    get_app().saved = False
+    st_p.set_uncompiled()
+
+
+@st_pf.profiled("save_notes")
+def submit_save(restored: str | None = None):
+    """
+    Hands a snapshot of the notes to the background saver, doesn't wait for it to be written.
+    restored is the version they were just restored from, if they were.
+    """
+
+    path = SECRETS["data_dir"] + get_app().name
+    records = [block.record() for block in get_app().blocks]
+    changed = {block.id for block in get_app().blocks if block.dirty}
+
+    # saving to the same file only journals what changed since the last save
+    st_sv.get_app().submit(st_sv.Snapshot(path, get_app().block_id, records, changed, full=get_app().file != path, restored=restored))
+    get_app().file = path # saved (and the blocks clean) once the saver says so, see take_saved
+
+def take_saved() -> None:
+    """
+    Catches up with what the saver wrote. Blocks that haven't changed since are clean,
+    and the notes are saved if they're still what was written (and no later save failed).
+    """
+
+    if st_sv.get_app().status == "failed": # whatever made it before, the changes since didn't
+        get_app().saved = False
+
+    snapshot = st_sv.get_app().take_written()
+    if snapshot is None or snapshot.path != SECRETS["data_dir"] + get_app().name: # other notes, opened since
+        return
+
+    written = {record[0]: record for record in snapshot.records}
+    records = [block.record() for block in get_app().blocks]
+
+    for block, record in zip(get_app().blocks, records):
+        if written.get(block.id) == record: # unchanged content is the very same object, a cheap comparison
+            block.dirty = False
+
+    get_app().last_saved = st_sv.get_app().last_saved
+    get_app().saved = st_sv.get_app().status != "failed" and tuple(records) == snapshot.records
+
 def save_notes():
-    with open(SECRETS["data_dir"] + get_app().name, "wb") as f:
-        dill.dump(get_app(), f)
-    get_app().saved = True
-    get_app().last_saved = time.time()
+    submit_save()
     st.rerun()
 
+def save_status_text() -> str:
+    match st_sv.get_app().status:
+        case "saving":
+            return "saving..."
+        case "failed":
+            return f"save failed ({st_sv.get_app().error})"
+        case _:
+            return "saved" if get_app().saved else "unsaved"
+
+@st.fragment(run_every=STATUS_EVERY)
+def save_status():
+    # runs on its own timer, so autosave doesn't depend on something else triggering a rerun
+    with st_pf.rerun("fragment"):
+        take_saved()
+
+        # a failed save leaves last_saved as it was, the next tick tries again
+        if st.session_state.get("autosave") and not get_app().name_is_new() and not get_app().saved and not st_sv.get_app().busy():
+            if get_app().last_saved is None or time.time() - get_app().last_saved > SAVE_EVERY:
+                with st_pf.timed("autosave"):
+                    submit_save()
+
+    st.markdown(f"**Status**: _{save_status_text()}_")
+
 @st.dialog("Save notes as")
 def save_notes_as():
     st.text("Note: Include the extension (for example: notes.pkl or notes.notes)")
@@ -249,27 +638,152 @@ def save_notes_as():
         save_notes()
         st.rerun()
 
-@st.dialog("Open notes")
+@st.dialog("Open notes", width="large")
 def open_notes():
     if not get_app().saved and len(get_app().blocks) != 1:
         st.warning("Warning: You have unsaved changes!", icon=":material/warning:")
 
-    name = st.selectbox("Choose a file", listdir(SECRETS["data_dir"]))
+    # described by the catalog, only files that changed since it last saw them are read
+    catalog = st_c.get_catalog(SECRETS["data_dir"]).refresh()
+    query = st.text_input("Filter", placeholder="Name or title").lower()
+
+    rows = []
+    for file, entry in sorted(catalog.items(), key=lambda item: item[1]["modified"], reverse=True):
+        if query in file.lower() or query in (entry["title"] or "").lower():
+            rows.append({
+                "": f"data:image/png;base64,{entry['thumbnail']}" if entry["thumbnail"] else None,
+                "Title": entry["title"],
+                "File": file,
+                "Blocks": entry["text_blocks"] + entry["image_blocks"],
+                "Drawings": entry["image_blocks"],
+                "Size (KB)": entry["size"] / 1024,
+                "Modified": datetime.fromtimestamp(entry["modified"]),
+            })
+
+    selection = st.dataframe(rows, hide_index=True, use_container_width=True, on_select="rerun", selection_mode="single-row",
+        key=f"catalog_{query}", column_config={ # the table sorts itself by any column
+            "": st.column_config.ImageColumn(width="small"),
+            "Size (KB)": st.column_config.NumberColumn(format="%.1f"),
+            "Modified": st.column_config.DatetimeColumn(format="YYYY-MM-DD HH:mm"),
+        })
+
+    selected = selection.selection.rows
+    name = rows[selected[0]]["File"] if selected and selected[0] < len(rows) else None
     col1, col2 = st.columns(2)
 
     if col1.button("Cancel", type="primary", use_container_width=True):
         st.rerun()
     
     elif col2.button("Open", use_container_width=True, disabled=name is None):
-        with open(SECRETS["data_dir"] + name, "rb") as f:
-            loaded_app: App = dill.load(f)
-            restart_app_singleton()
-            get_app().name = name
-            get_app().blocks = loaded_app.blocks
-            get_app().block_id = loaded_app.block_id
-            get_app().saved = True
-            st_p.set_uncompiled()
+        load_notes(name)
+        st.rerun()
+
+@st_pf.profiled("open_notes")
+def load_notes(name: str, block_id: int | None = None) -> None:
+    """Opens the notes called name in the data directory, showing block_id if it's given."""
+
+    block_id_counter, records = st_s.load(SECRETS["data_dir"] + name) # images are only read when shown
+    restart_app_singleton()
+    get_app().name = name
+    get_app().set_blocks([Block(type, content, id) for id, type, content in records], block_id_counter)
+    get_app().file = SECRETS["data_dir"] + name
+    get_app().saved = True
+    st_p.set_uncompiled()
+
+    if block_id in get_app().by_id:
+        get_app().focus = get_app().position(block_id)
+
+@st.dialog("Open notes")
+def open_search_hit(name: str, block_id: int):
+    st.warning("Warning: You have unsaved changes!", icon=":material/warning:")
+    col1, col2 = st.columns(2)
 
+    if col1.button("Cancel", type="primary", use_container_width=True):
+        st.rerun()
+
+    elif col2.button(f"Open {name}", use_container_width=True):
+        load_notes(name, block_id)
+        st.rerun()
+
+def search_menu():
+    query = st.text_input("Search", placeholder="Search all notes", key="search")
+    if not query.strip():
+        return
+
+    if not st.session_state.get("search_refreshed"): # other sessions (or people) may have changed files
+        st_se.get_index(SECRETS["data_dir"]).refresh()
+        st.session_state.search_refreshed = True
+
+    hits = st_se.search(SECRETS["data_dir"], query, limit=8)
+    if not hits:
+        st.caption("No results")
+
+    for i, hit in enumerate(hits):
+        if st.button(f"**{hit.title or hit.name}** \u00b7 {hit.snippet}", key=f"hit_{i}", help=hit.name, use_container_width=True):
+            if get_app().file == SECRETS["data_dir"] + hit.name: # these notes, possibly edited since
+                if hit.block_id in get_app().by_id:
+                    get_app().focus = get_app().position(hit.block_id)
+                st.rerun()
+
+            elif not get_app().saved and len(get_app().blocks) != 1:
+                open_search_hit(hit.name, hit.block_id)
+
+            else:
+                load_notes(hit.name, hit.block_id)
+                st.rerun()
+
+@st.dialog("Versions", width="large")
+def versions_menu():
+    store = st_v.get_store(SECRETS["data_dir"])
+    versions = store.versions(get_app().name) if not get_app().name_is_new() else []
+
+    if not versions:
+        st.caption("No versions yet, one is kept every time the notes are saved")
+        return
+
+    if not get_app().saved:
+        st.warning("Warning: You have unsaved changes!", icon=":material/warning:")
+
+    rows, previous = [], None
+    for version in versions:
+        rows.append({
+            "Saved": datetime.fromtimestamp(version.time),
+            "Blocks": len(version.blocks),
+            "Changes": st_v.describe(store.diff(previous, version, lines=False)) + (" (restored)" if version.restored else ""),
+            "Version": version.id,
+        })
+        previous = version
+
+    rows.reverse() # newest first
+    selection = st.dataframe(rows, hide_index=True, use_container_width=True, on_select="rerun", selection_mode="single-row",
+        column_config={"Saved": st.column_config.DatetimeColumn(format="YYYY-MM-DD HH:mm:ss")})
+
+    selected = selection.selection.rows
+    version = store.find(get_app().name, rows[selected[0]]["Version"]) if selected and selected[0] < len(rows) else None
+
+    if version is not None:
+        # against the blocks as they are now, saved or not
+        changes = store.diff(version, [block.record() for block in get_app().blocks])
+        st.markdown(f"**Since this version**: {st_v.describe(changes)}")
+
+        lines = [f"{change.kind} {change.type} block {change.id}" + "".join(f"\n    {line}" for line in change.lines) for change in changes]
+        if lines:
+            st.code("\n".join(lines), language="diff")
+
+    col1, col2 = st.columns(2)
+
+    if col1.button("Cancel", type="primary", use_container_width=True):
+        st.rerun()
+
+    elif col2.button("Restore", use_container_width=True, disabled=version is None):
+        name = get_app().name
+        restart_app_singleton()
+        get_app().name = name
+        get_app().set_blocks([Block(type, content, id) for id, type, content in store.records(version)], version.block_id)
+        st_p.set_uncompiled()
+
+        # a whole new snapshot, written after whatever the saver is busy with, and instead of what it hasn't started on
+        submit_save(restored=version.id)
         st.rerun()
 
 @st.dialog("New notes")
@@ -293,19 +807,20 @@ def sidebar():
     with st.sidebar:
         st.title("SNOTESAPP")
         st.markdown(f"**Filename**: _{get_app().name}_")
-        st.markdown(f"**Status**: _{'saved' if get_app().saved else 'unsaved'}_")
+        save_status()
 
-        row = st_r.row(4) #? consider changing for a column
-        if row.button("", icon=":material/add_circle:", use_container_width=True, help="New notes"):
+        # columns, streamlit_extras' row pulls in pandas at startup
+        col1, col2, col3, col4 = st.columns(4)
+        if col1.button("", icon=":material/add_circle:", use_container_width=True, help="New notes"):
             new_notes()
 
-        if row.button("", icon=":material/edit_document:", use_container_width=True, help="Open notes"):
+        if col2.button("", icon=":material/edit_document:", use_container_width=True, help="Open notes"):
             open_notes()
 
-        if row.button("", icon=":material/save:", use_container_width=True, help="Save notes"):
+        if col3.button("", icon=":material/save:", use_container_width=True, help="Save notes"):
             save_notes()
 
-        if row.button("", icon=":material/save_as:", use_container_width=True, help="Save notes as"):
+        if col4.button("", icon=":material/save_as:", use_container_width=True, help="Save notes as"):
             save_notes_as()
 
         past_ge = global_editing
@@ -320,18 +835,32 @@ def sidebar():
 
         st.text(f"Blocks: {len(get_app().blocks)}")
 
-        if st.toggle("Periodically save", help="Periodically saves the project every 5 minutes if it has been asigned a custom name", value=False):
-            if not get_app().name_is_new():
-                if get_app().last_saved:
-                    if time.time() - get_app().last_saved > SAVE_EVERY:
-                        save_notes()
-                else:
-                    save_notes()
+        st.toggle("Periodically save", help="Periodically saves the project every 5 minutes if it has been asigned a custom name", value=False, key="autosave")
+
+        col1, col2, col3 = st.columns(3)
+        col1.button("", icon=":material/undo:", use_container_width=True, help="Undo",
+            on_click=undo, disabled=not st_h.get_app().can_undo())
+        col2.button("", icon=":material/redo:", use_container_width=True, help="Redo",
+            on_click=redo, disabled=not st_h.get_app().can_redo())
+        if col3.button("", icon=":material/history:", use_container_width=True, help="Versions"):
+            versions_menu()
+
+        outline_menu()
+        search_menu()
+
+        st_p.print_menu(get_app().get_title(), get_app().make_printable)
+        st_pf.panel()
 
+def outline_menu():
+    outline = get_app().outline()
 
-        # add undo, redo here
+    def jump():
+        if st.session_state.outline is not None:
+            get_app().focus = outline[st.session_state.outline][0]
+            st.session_state.outline = None
 
-        st_p.print_menu(get_app().get_title(), get_app().make_printable())
+    st.selectbox("Outline", range(len(outline)), index=None, placeholder="Jump to...", key="outline", on_change=jump,
+        format_func=lambda i: "\u2003" * max(outline[i][1] - 1, 0) + (outline[i][2] or "(untitled)"))
 
 
 @st.dialog("Add a new block")
@@ -346,11 +875,10 @@ def add_block(index=None):
         st_p.set_uncompiled()
         match type:
             case "text":
-                get_app().blocks.insert(index, Block("text", "..."))
+                get_app().insert_block(index, Block("text", "..."))
 
             case "image":
-                default = numpy.array(Image.new("RGBA", (500, 400),  (0, 0, 0, 0)))
-                get_app().blocks.insert(index, Block("image", default))
+                get_app().insert_block(index, Block("image", st_i.CompactImage.blank(500, 400)))
 
     if col1.button("Cancel", type="primary", use_container_width=True):
         st.rerun()
@@ -359,20 +887,76 @@ def add_block(index=None):
         st.rerun()
 
 
-def main():
-    if "app" not in st.session_state: # first time running this
-        restart_app_singleton()
+def manage_memory():
+    """Adds up what the session holds. Over the budget, drawings and canvases of blocks that aren't being edited go to disk."""
 
-    sidebar()
+    usage = {"images": 0, "canvas pixels": 0, "canvases": 0, "history": st_h.get_app().nbytes}
+    candidates = []
+    canvases = st.session_state.get("canvas", {})
 
-    # main functionality
     for block in get_app().blocks:
-        block.render(global_editing)
+        if block.type != "image":
+            continue
+
+        if not block.editing:
+            block.canvas_data = None # only compared against while its canvas is shown
+
+        image = block._content # without converting what older versions stored
+        if isinstance(image, st_i.CompactImage):
+            usage["images"] += image.nbytes()
+
+            if image.nbytes() and not block.editing:
+                candidates.append((block.id, image.nbytes(), lambda image=image: image.spill(st_m.get_app().write)))
+
+        if block.canvas_data is not None:
+            usage["canvas pixels"] += block.canvas_data.nbytes
+
+    editing = {block.id for block in get_app().blocks if block.editing}
+    for key, canvas in canvases.items(): # deleted blocks' canvases too
+        if canvas.spilled is not None:
+            continue
+
+        usage["canvases"] += canvas.nbytes()
+        id = int(key.removeprefix("canvas_"))
+
+        if id not in editing and canvas.buffer.count:
+            candidates.append((id, canvas.nbytes(), lambda key=key: st_cv.spill(key, st_m.get_app().write)))
+
+    st_m.get_app().enforce(usage, candidates)
+
+def main():
+    with st_pf.rerun("app"):
+        if "app" not in st.session_state: # first time running this
+            restart_app_singleton()
+
+        st_h.get_app().seal() # what this run changes is one undo step
+        get_app().rerun_requested = False # this is the rerun
+
+        sidebar()
+
+        # main functionality, long notes are shown a page at a time
+        start, end = get_app().visible_range()
+
+        if start > 0:
+            st.button(f"{start} blocks above", icon=":material/expand_less:", use_container_width=True,
+                on_click=lambda: setattr(get_app(), "focus", max(start - PAGE_SIZE + PAGE_SIZE // 5, 0)))
+
+        for block in get_app().blocks[start:end]:
+            block.render(global_editing)
+
+        if end < len(get_app().blocks):
+            st.button(f"{len(get_app().blocks) - end} blocks below", icon=":material/expand_more:", use_container_width=True,
+                on_click=lambda: setattr(get_app(), "focus", end + PAGE_SIZE // 5))
+
+        if global_editing:
+            _, center, _ = st.columns([1.5, 1, 1.5])
+            with center:
+                st.button("Add new block", on_click=add_block, icon=":material/library_add:", use_container_width=True)
+
+        st_h.get_app().seal()
 
-    if global_editing:
-        _, center, _ = st.columns([1.5, 1, 1.5])
-        with center:
-            st.button("Add new block", on_click=add_block, icon=":material/library_add:", use_container_width=True)
+        with st_pf.timed("memory"):
+            manage_memory()
 
 
 if __name__ == "__main__":
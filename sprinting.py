@@ -1,18 +1,27 @@
-from copy import deepcopy as copy
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from collections import OrderedDict
+from simages import CompactImage
+from threading import Thread, Lock
+from base64 import b64encode
+from typing import Callable
 from PIL.Image import Image
+from os import cpu_count
+from hashlib import sha1
+from sconfig import SECRETS
+import sstorage as st_s
+import stypst as st_t
+import svectors as st_vx
+import sprofiler as st_pf
+from io import BytesIO
 import streamlit as st
 import numpy as np
-import typst
-import tomli
 import PIL
 
 
-SECRETS = tomli.load(open("./secrets.toml", "rb"))
-
-
 class App():
     def __init__(self):
         self.compiled = None
+        self.job: "Job | None" = None
 
 def get_app() -> App:
     return st.session_state.printing
@@ -28,57 +37,250 @@ def get_app() -> App:
 def set_uncompiled():
     get_app().compiled = None
 
+    if get_app().job is not None: # it's compiling what's about to change
+        get_app().job.cancel()
+        get_app().job = None
 
-def compile(title: str, printable: list[str, Image]) -> bytes:
-    """Compiles the printable into a pdf returning the bytes"""
 
-    body = ""
+# $svg
+IMAGE = '#align(center, [#image(bytes("$svg"), format: "svg")])\n\n'
+
+# $body
+MD_TEXT = "#cmarker.render(```\n$body\n```, math: mitex)\n\n"
+
+# generated typst per block, keyed by content hash, shared by every session
+FRAGMENT_CACHE_SIZE = 512
+_fragments: "OrderedDict[str, str]" = OrderedDict()
+_fragments_lock = Lock()
+
+
+def invert_if_light(crop: np.ndarray) -> None:
+    """Drawings made with light strokes (the canvas is dark) are inverted so they show on paper. In place."""
+
+    non_transparent = crop[..., 3] > 0
+    rgb = crop[..., :3]
+    luminance = rgb[non_transparent] @ np.array([0.299, 0.587, 0.114])
+
+    if luminance.size and luminance.mean() > 127:
+        np.subtract(255, rgb, out=rgb, where=non_transparent[..., None])
+
+def image_svg(block: CompactImage) -> str:
+    """
+    The image as an svg the size of the canvas. Drawn with the canvas objects when it kept them,
+    otherwise with only its cropped region embedded as a png.
+    """
+
+    height, width = block.shape
+    inner = ""
+
+    if block.bbox is not None and block.vectors is not None:
+        objects = block.objects()
+
+        if st_vx.drawable(objects):
+            return st_vx.to_svg(objects, width, height) # light colors are remapped like invert_if_light does
+
+    if block.bbox is not None:
+        crop = block.crop()
+        invert_if_light(crop)
+
+        buffer = BytesIO()
+        PIL.Image.fromarray(crop).save(buffer, "PNG", compress_level=1)
+        data = b64encode(buffer.getvalue()).decode()
+
+        top, left, bottom, right = block.bbox
+        inner = f"<image x='{left}' y='{top}' width='{right - left}' height='{bottom - top}' href='data:image/png;base64,{data}'/>"
+
+    return f"<svg xmlns='http://www.w3.org/2000/svg' width='{width}' height='{height}' viewBox='0 0 {width} {height}'>{inner}</svg>"
+
+def fragment_key(block: str | CompactImage) -> str:
+    if type(block) == str:
+        return "text_" + sha1(block.encode()).hexdigest()
+
+    return "image_" + block.digest()
+
+def render_fragment(block: str | CompactImage) -> str:
+    """Typst for a single printable block."""
+
+    if type(block) == str:
+        return MD_TEXT.replace("$body", block)
+
+    return IMAGE.replace("$svg", image_svg(block))
+
+def fragment(block: str | CompactImage) -> str:
+    """Cached render_fragment, unchanged blocks reuse their typst (and their converted image)."""
+
+    if type(block) not in (str, CompactImage):
+        print(f"unknown type: {type(block)}")
+        return ""
+
+    key = fragment_key(block)
+
+    with _fragments_lock:
+        if key in _fragments:
+            _fragments.move_to_end(key)
+            return _fragments[key]
+
+    snippet = render_fragment(block)
+
+    with _fragments_lock:
+        _fragments[key] = snippet
+
+        while len(_fragments) > FRAGMENT_CACHE_SIZE:
+            _fragments.popitem(last=False)
+
+    return snippet
+
+def make_printable(records: list[st_s.Record]) -> tuple[str, list[str | CompactImage]]:
+    """Title and printable of a notebook's records, what App.make_printable gives for the open one."""
+
+    assert records and records[0][1] == "title", "the notes have no title block"
+    return records[0][2], [st_s.compact(content) if type == "image" else content for _, type, content in records[1:]]
 
-    # note: TYPST_TEMPLATE **has** to go here because otherwise it bugs out 99% of the time
+def make_source(title: str, printable: list[str, CompactImage], progress=None) -> str:
+    """Typst source for the printable, images are embedded in it. progress(done, total) is called per block."""
 
     # $title, $body #? $author, $lang? -> not for now -> future feature
-    TYPST_TEMPLATE = open("./template.typ", "r", encoding="utf-8").read()
+    TYPST_TEMPLATE = st_t.template() # read once, and again whenever it's edited
 
-    # $path
-    IMAGE = '#align(center, [#image("$path")])\n\n'
+    body = []
+    for i, snippet in enumerate(get_image_pool().map(fragment, printable)):
+        body.append(snippet)
 
-    # $body
-    MD_TEXT = "#cmarker.render(```\n$body\n```, math: mitex)\n\n"
+        if progress:
+            progress(i + 1, len(printable))
 
-    for i, block in enumerate(printable):
-        if type(block) == str:
-            body += MD_TEXT.replace("$body", block)
-        elif type(block) == np.ndarray:
-            numbers = copy(block)
-            r, g, b, a = numbers[..., 0], numbers[..., 1], numbers[..., 2], numbers[..., 3]
-            non_transparent = a > 0
+    return TYPST_TEMPLATE.replace("$body", "".join(body)).replace("$title", title)
 
-            luminance = (0.299 * r + 0.587 * g + 0.114 * b)[non_transparent]
+def typeset(source: str) -> bytes:
+    """Runs typst over an in memory source, this is what goes to the compile workers."""
 
-            if np.mean(luminance) > 127:
-                numbers[..., :3][non_transparent] = 255 - numbers[..., :3][non_transparent]
+    return st_t.compile(source) # on the worker's long lived compiler, fonts and packages are already loaded
 
-            img = PIL.Image.fromarray(numbers.astype("uint8"), mode="RGBA")
-            img.save("./cache/image_{i}.png", "PNG")
+def compile(title: str, printable: list[str, CompactImage]) -> bytes:
+    """Compiles the printable into a pdf returning the bytes"""
 
-            body += IMAGE.replace("$path", f"image_{i}.png")
-        else:
-            print(f"unknown type: {type(block)}")
+    return typeset(make_source(title, printable))
 
-    with open(f"./cache/temp_typst.typ", "w+", encoding="utf-8") as f:
-        f.write(TYPST_TEMPLATE.replace("$body", body).replace("$title", title))
-        f.close()
 
-    return typst.compile("./cache/temp_typst.typ", format="pdf")
+COMPILE_WORKERS = 2 # typst runs at once, shared by every session
+POLL_EVERY = 1 # in seconds, how often the sidebar checks on a running compile
+IMAGE_WORKERS = cpu_count() or 2 # image blocks converted at once (PIL and numpy release the GIL)
+_pool = None
+_image_pool = None
+_pool_lock = Lock()
 
+def get_pool() -> ThreadPoolExecutor:
+    # threads and not processes: typst releases the GIL while it compiles, and spawned processes
+    # would re-run this app's script (streamlit registers it as __main__) before doing any work
+    global _pool
 
-def print_menu(title: str, printable: list[str, Image]):
-    if not "printing" in st.session_state:
-        st.session_state.printing = App()
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=COMPILE_WORKERS, thread_name_prefix="snotes-typst")
+
+        return _pool
+
+def get_image_pool() -> ThreadPoolExecutor:
+    global _image_pool
+
+    with _pool_lock:
+        if _image_pool is None:
+            _image_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="snotes-images")
+
+        return _image_pool
+
+
+class Job:
+    """
+    A compile running in the background. The typst fragments are built on the job's own thread,
+    then typst itself runs on the shared compile pool.
+    state is one of "preparing", "typesetting", "done", "failed" or "cancelled".
+    """
+
+    def __init__(self, title: str, printable: list[str, CompactImage]):
+        self.title = title
+        self.printable = printable
+        self.state = "preparing"
+        self.progress = 0.0
+        self.result: bytes | None = None
+        self.error = None
+        self.future = None
+        self.profiler = st_pf.current() # of the session that asked for it
+        self.thread = Thread(target=self.run, name="snotes-compile", daemon=True)
+        self.thread.start()
+
+    def set_progress(self, done: int, total: int):
+        self.progress = 0.5 * done / max(total, 1) # the other half is typst
+
+    def run(self):
+        try:
+            with st_pf.timed("compile.source", self.profiler):
+                source = make_source(self.title, self.printable, self.set_progress)
+
+            if self.state == "cancelled":
+                return
+
+            self.state = "typesetting"
+            self.future = get_pool().submit(typeset, source)
+
+            with st_pf.timed("compile.typst", self.profiler): # waiting for a free worker included
+                result = self.future.result()
+
+            if self.state != "cancelled":
+                self.result = result
+                self.progress = 1.0
+                self.state = "done"
+
+        except CancelledError:
+            self.state = "cancelled"
+
+        except Exception as e:
+            if self.state != "cancelled":
+                self.error = str(e)
+                self.state = "failed"
+
+    def cancel(self):
+        """A pending typst run is dropped, a running one finishes but its result is thrown away."""
+
+        self.state = "cancelled"
+
+        if self.future is not None:
+            self.future.cancel()
+
+    def finished(self) -> bool:
+        return self.state in ("done", "failed", "cancelled")
+
+
+def compile_menu(title: str, get_printable: Callable[[], list[str | CompactImage]]):
+    # the blocks rerun on their own, arguments captured on the last full run could be stale by now
+    job = get_app().job
+
+    if job is not None and job.state == "done":
+        get_app().compiled = job.result
+        get_app().job = None
+        st.rerun() # stops the polling
 
     col1, col2 = st.columns([1, 2])
 
     if col1.button("Compile", use_container_width=True):
-        get_app().compiled = compile(title, printable)
+        if job is not None:
+            job.cancel() # older compiles of these notes are stale now
+
+        get_app().compiled = None
+        get_app().job = Job(title, get_printable())
+        st.rerun()
 
     col2.download_button("Download PDF", data=get_app().compiled or bytes(), file_name=f"{title}.pdf", disabled=get_app().compiled is None, use_container_width=True, icon=":material/file_save:")
+
+    if job is not None and not job.finished():
+        st.progress(job.progress, text=f"{job.state.capitalize()}...")
+    elif job is not None and job.state == "failed":
+        st.error(f"Compile failed: {job.error}", icon=":material/error:")
+
+def print_menu(title: str, get_printable: Callable[[], list[str | CompactImage]]):
+    if not "printing" in st.session_state:
+        st.session_state.printing = App()
+
+    # only polls while a compile is running, the fragment rerun doesn't touch the rest of the page
+    running = get_app().job is not None and not get_app().job.finished()
+    st.fragment(compile_menu, run_every=POLL_EVERY if running else None)(title, get_printable)
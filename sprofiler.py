@@ -0,0 +1,249 @@
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from contextlib import contextmanager
+from collections import deque
+from functools import wraps
+from threading import Lock, current_thread
+from sconfig import SECRETS
+import smemory as st_m
+import streamlit as st
+import time
+import json
+
+
+# opt-in instrumentation: `profiling = true` in secrets.toml, or ?profile in the url.
+# every script run (a whole rerun or a fragment on its own) collects the spans timed during it,
+# background work (the saver, compiles) is added to whichever run is open when it finishes.
+
+ROLLING_RUNS = 50 # runs kept, for the rolling breakdown and the trace
+MAX_SPANS = 5000 # per run, a runaway loop shouldn't eat the memory it's measuring
+MEMORY_EVERY = 5 # in seconds, walking the session state isn't free with big canvases
+
+
+class Span:
+    def __init__(self, name: str, start: float, duration: float, thread: str):
+        self.name = name
+        self.start = start # perf_counter
+        self.duration = duration # seconds
+        self.thread = thread
+
+
+class Run:
+    def __init__(self, kind: str):
+        self.kind = kind # "app" or "fragment"
+        self.start = time.perf_counter()
+        self.wall = time.time()
+        self.duration = None # set when it ends
+        self.spans: list[Span] = []
+        self.memory: dict[str, int] | None = None # bytes per session state key, when it was measured
+
+    def breakdown(self) -> dict[str, tuple[int, float]]:
+        """Calls and total seconds per timer."""
+
+        totals = {}
+        for span in self.spans:
+            calls, total = totals.get(span.name, (0, 0.0))
+            totals[span.name] = (calls + 1, total + span.duration)
+
+        return totals
+
+
+class App:
+    """Per session profiler, the last ROLLING_RUNS runs."""
+
+    def __init__(self):
+        self.lock = Lock() # background threads add spans too
+        self.runs: deque[Run] = deque(maxlen=ROLLING_RUNS)
+        self.open: Run | None = None
+        self.memory: dict[str, int] = {}
+        self.memory_measured = 0.0
+
+    def begin(self, kind: str) -> None:
+        with self.lock:
+            self.open = Run(kind)
+
+    def end(self) -> None:
+        with self.lock:
+            run, self.open = self.open, None
+            run.duration = time.perf_counter() - run.start
+
+            if run.kind == "app" or run.spans: # idle fragment runs (the status timer) aren't worth keeping
+                self.runs.append(run)
+
+    def add(self, name: str, start: float, duration: float) -> None:
+        with self.lock:
+            run = self.open or (self.runs[-1] if self.runs else None)
+
+            if run is not None and len(run.spans) < MAX_SPANS:
+                run.spans.append(Span(name, start, duration, current_thread().name))
+
+    def rolling(self) -> dict[str, tuple[float, float, float]]:
+        """Calls per run, mean and max seconds per run, for every timer over the kept runs."""
+
+        with self.lock:
+            runs = [run.breakdown() for run in self.runs]
+
+        names = {name for breakdown in runs for name in breakdown}
+        rolling = {}
+
+        for name in names:
+            calls = [breakdown.get(name, (0, 0.0))[0] for breakdown in runs]
+            totals = [breakdown.get(name, (0, 0.0))[1] for breakdown in runs]
+            rolling[name] = (sum(calls) / len(runs), sum(totals) / len(runs), max(totals))
+
+        return rolling
+
+    def trace(self) -> str:
+        """Chrome trace event json (chrome://tracing, ui.perfetto.dev) of the kept runs."""
+
+        with self.lock:
+            runs = list(self.runs)
+
+        if not runs:
+            return json.dumps({"traceEvents": []})
+
+        # perf_counter has no epoch, the first run's wall clock time anchors it
+        origin = runs[0].start
+        events = []
+
+        def us(seconds: float) -> float:
+            return round(seconds * 1e6, 1)
+
+        for run in runs:
+            events.append({"name": f"{run.kind} run", "cat": "run", "ph": "X", "ts": us(run.start - origin),
+                "dur": us(run.duration), "pid": 1, "tid": "script"})
+
+            for span in run.spans:
+                thread = "script" if span.thread.startswith("ScriptRunner") else span.thread
+                events.append({"name": span.name, "cat": run.kind, "ph": "X", "ts": us(span.start - origin),
+                    "dur": us(span.duration), "pid": 1, "tid": thread})
+
+            if run.memory is not None:
+                events.append({"name": "session state (bytes)", "ph": "C", "ts": us(run.start - origin), "pid": 1,
+                    "args": {"total": sum(run.memory.values())}})
+
+        return json.dumps({"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"started": runs[0].wall}})
+
+
+def memory_by_key() -> dict[str, int]:
+    """Bytes per session state key, something shared by two keys counts for the first one."""
+
+    seen = set()
+    return {key: st_m.deep_size(st.session_state[key], seen) for key in list(st.session_state.keys())}
+
+
+def enabled() -> bool:
+    return bool(SECRETS.get("profiling")) or "profile" in st.query_params
+
+def get_app() -> App:
+    if not "profiler" in st.session_state:
+        st.session_state.profiler = App()
+
+    return st.session_state.profiler
+
+def current() -> App | None:
+    """The profiler of the session running this thread, None if it has none (or it's not a script thread)."""
+
+    if get_script_run_ctx(suppress_warning=True) is None: # a background thread, or no server at all (sbench)
+        return None
+
+    return st.session_state.get("profiler")
+
+@contextmanager
+def rerun(kind: str):
+    """Wraps a script run. Inside another one (a fragment rendered by a full rerun), it's part of that one."""
+
+    if kind == "app" and "profiler" not in st.session_state and enabled():
+        get_app()
+
+    app = current()
+    if app is None or app.open is not None:
+        yield
+        return
+
+    app.begin(kind)
+
+    try:
+        yield
+    finally:
+        if kind == "app" and time.time() - app.memory_measured > MEMORY_EVERY:
+            with timed("session memory", app):
+                app.memory = memory_by_key()
+
+            app.memory_measured = time.time()
+            app.open.memory = app.memory
+
+        app.end()
+
+@contextmanager
+def timed(name: str, app: App | None = None):
+    """
+    Adds how long the block took to the current run. Background threads pass the session's
+    profiler, captured before they started.
+    """
+
+    app = app if app is not None else current()
+    if app is None:
+        yield
+        return
+
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        app.add(name, start, time.perf_counter() - start)
+
+def profiled(name: str):
+    """Decorator version of timed."""
+
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def panel():
+    """Sidebar debug panel, only shown to sessions that opted in."""
+
+    app = current()
+    if app is None:
+        return
+
+    with st.expander("Profiler", icon=":material/speed:"):
+        if not app.runs:
+            st.caption("Nothing measured yet")
+            return
+
+        last = next((run for run in reversed(app.runs) if run.kind == "app"), app.runs[-1])
+        st.caption(f"Last full rerun: {last.duration * 1000:.1f}ms, session state: {sum(app.memory.values()) / 1e6:.1f}MB")
+
+        st.markdown("**Last rerun**")
+        st.dataframe([{"Timer": name, "Calls": calls, "ms": total * 1000} for name, (calls, total) in
+            sorted(last.breakdown().items(), key=lambda item: item[1][1], reverse=True)],
+            hide_index=True, use_container_width=True, column_config={"ms": st.column_config.NumberColumn(format="%.2f")})
+
+        st.markdown(f"**Last {len(app.runs)} runs**")
+        st.dataframe([{"Timer": name, "Calls/run": calls, "Mean ms": mean * 1000, "Max ms": peak * 1000}
+            for name, (calls, mean, peak) in sorted(app.rolling().items(), key=lambda item: item[1][1], reverse=True)],
+            hide_index=True, use_container_width=True, column_config={
+                "Calls/run": st.column_config.NumberColumn(format="%.1f"),
+                "Mean ms": st.column_config.NumberColumn(format="%.2f"),
+                "Max ms": st.column_config.NumberColumn(format="%.2f"),
+            })
+
+        st.markdown("**Session state**")
+        if "memory" in st.session_state:
+            memory = st_m.get_app()
+            st.caption(f"Budget: {memory.used() / 1e6:.1f} of {memory.budget / 1e6:.0f}MB used, "
+                f"{memory.spills} spills to disk ({memory.spilled_bytes / 1e6:.1f}MB)")
+
+        st.dataframe([{"Key": key, "KB": size / 1024} for key, size in sorted(app.memory.items(), key=lambda item: item[1], reverse=True)],
+            hide_index=True, use_container_width=True, column_config={"KB": st.column_config.NumberColumn(format="%.1f")})
+
+        st.download_button("Export trace", data=app.trace(), file_name="snotes-trace.json", mime="application/json",
+            icon=":material/download:", use_container_width=True)
@@ -0,0 +1,114 @@
+from threading import Thread, Lock
+import streamlit as st
+import sstorage as st_s
+import ssearch as st_se
+import scatalog as st_c
+import sversions as st_v
+import sprofiler as st_pf
+import time
+
+
+class Snapshot:
+    """Everything a save needs, captured on the script thread so the writer never touches the live blocks."""
+
+    def __init__(self, path: str, block_id: int, records: list[st_s.Record], changed: set[int], full: bool, restored: str | None = None):
+        self.path = path
+        self.block_id = block_id
+        self.records = tuple(records)
+        self.changed = changed # ids of the blocks that changed since the previous snapshot
+        self.full = full # write a whole new snapshot instead of journaling the changes
+        self.restored = restored # id of the version these records were restored from (see sversions)
+
+
+class App:
+    """Per session save service. Snapshots are written on a background thread, bursts of them are coalesced."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.pending: dict[str, Snapshot] = {} # by path, in the order they were first submitted
+        self.thread: Thread | None = None
+        self.status = None # None, "saving", "saved" or "failed"
+        self.error = None
+        self.last_saved = None
+        self.written: Snapshot | None = None # the last snapshot that made it to disk, until the session takes it
+        self.force_full: set[str] = set() # paths whose last write failed, its journal record was lost
+        self.profiler = None # of the session, the writer thread has no session of its own
+
+    def submit(self, snapshot: Snapshot) -> None:
+        self.profiler = st_pf.current()
+
+        with self.lock:
+            # not written yet, the newest records win and the changes add up. only for the same file,
+            # one for other notes (opened or saved as since) is written after it
+            pending = self.pending.get(snapshot.path)
+            if pending is not None:
+                snapshot.changed |= pending.changed
+                snapshot.full |= pending.full
+                snapshot.restored = snapshot.restored or pending.restored # the restore wasn't recorded yet
+
+            self.pending[snapshot.path] = snapshot
+            self.status = "saving"
+
+            if self.thread is None:
+                self.thread = Thread(target=self.run, name="snotes-saver", daemon=True)
+                self.thread.start()
+
+    def run(self) -> None:
+        while True:
+            with self.lock:
+                if not self.pending: # drained, a later submit starts a new thread
+                    self.thread = None
+                    return
+
+                snapshot = self.pending.pop(next(iter(self.pending)))
+                full = snapshot.full or snapshot.path in self.force_full
+
+            try:
+                with st_pf.timed("save.write", self.profiler):
+                    if full:
+                        st_s.save(snapshot.path, snapshot.block_id, list(snapshot.records))
+                    else:
+                        st_s.append(snapshot.path, snapshot.block_id, list(snapshot.records), snapshot.changed)
+
+            except Exception as e:
+                with self.lock:
+                    self.force_full.add(snapshot.path)
+                    self.error = str(e)
+                    self.status = "saving" if self.pending else "failed"
+
+            else:
+                with self.lock:
+                    self.force_full.discard(snapshot.path)
+                    self.error = None
+                    self.last_saved = time.time()
+                    self.written = snapshot
+                    self.status = "saving" if self.pending else "saved"
+
+                # the notes are saved, if these fail they catch up on their next refresh (versions on the next save)
+                for sidecar in (st_se, st_c):
+                    try:
+                        sidecar.update(snapshot.path, list(snapshot.records))
+                    except Exception:
+                        pass
+
+                try:
+                    st_v.update(snapshot.path, snapshot.block_id, list(snapshot.records), snapshot.restored)
+                except Exception:
+                    pass
+
+    def take_written(self) -> Snapshot | None:
+        """The last snapshot written since this was last called, None if there's none."""
+
+        with self.lock:
+            snapshot, self.written = self.written, None
+
+        return snapshot
+
+    def busy(self) -> bool:
+        return self.status == "saving"
+
+def get_app() -> App:
+    if not "saving" in st.session_state:
+        st.session_state.saving = App()
+
+    return st.session_state.saving
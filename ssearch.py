@@ -0,0 +1,272 @@
+from os.path import join, basename, dirname, exists
+from threading import Lock
+import ssidecars as st_sd
+import sstorage as st_s
+import unicodedata
+import hashlib
+import heapq
+import bisect
+import math
+import os
+import re
+
+
+# .search.json and .search.journal, next to the notes they index (see ssidecars), entries are
+#   {"stat", "title", "blocks": [[id, type, terms, length, snippet]]}
+# stat is (mtime, size) of the file and of its journal, a file whose stat changed is reindexed from its manifest.
+# the inverted index (term -> block -> count) is built from them in memory when they're loaded.
+
+INDEX_NAME = ".search.json"
+JOURNAL_NAME = ".search.journal"
+INDEX_VERSION = 2
+PREFIX_EXPANSIONS = 50 # the last word of a query matches terms starting with it, up to this many
+TITLE_BOOST = 2.0
+BM25_K1 = 1.2
+BM25_B = 0.75
+SNIPPET_LENGTH = 80
+
+WORD = re.compile(r"\w+")
+
+
+def terms(text: str) -> list[str]:
+    """Lowercase words of text, accents removed ("Canción" and "cancion" are the same term)."""
+
+    text = text.lower()
+
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+    return WORD.findall(text)
+
+def snippet(type: str, text: str) -> str:
+    """Short preview of a block: the title, or the first line with something in it."""
+
+    line = next((line.strip("# \t") for line in text.splitlines() if line.strip("# \t")), "") if type != "title" else text
+    return line if len(line) <= SNIPPET_LENGTH else line[:SNIPPET_LENGTH - 3] + "..."
+
+def file_hash(path: str) -> str:
+    """sha1 of the notes at path and their journal (see sexport)."""
+
+    h = hashlib.sha1()
+
+    for part in (path, st_s.journal_path(path)):
+        if exists(part):
+            with open(part, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+
+    return h.hexdigest()
+
+def is_notes(name: str) -> bool:
+    return not name.startswith(".") # same rule as the open dialog, dotfiles are journals and temporary files
+
+
+class Hit:
+    def __init__(self, score: float, name: str, block_id: int, title: str, snippet: str):
+        self.score = score
+        self.name = name # file, relative to the data directory
+        self.block_id = block_id
+        self.title = title # of the notes
+        self.snippet = snippet # of the block
+
+
+class Index:
+    """Inverted index over the titles and text blocks of every notes file in a directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.stored = st_sd.EntryFile(join(directory, INDEX_NAME), join(directory, JOURNAL_NAME), INDEX_VERSION)
+        self.lock = Lock()
+        self.files: dict[str, dict] = {}
+        self.postings: dict[str, dict[int, int]] = {} # term -> document -> count
+        self.documents: dict[int, tuple[str, int, str, int, str]] = {} # document -> (name, block id, type, length, snippet)
+        self.file_documents: dict[str, list[int]] = {} # name -> its documents
+        self.next_document = 0 # plain ints keep the postings small, blocks get a new one when reindexed
+        self.total_length = 0
+        self.sorted_terms: list[str] | None = None # for prefix matching, rebuilt when terms change
+
+        try:
+            self.stored.load(self.apply)
+        except (OSError, ValueError, KeyError):
+            self.clear() # unreadable, it's rebuilt from the notes by refresh()
+
+    def apply(self, name: str, entry: dict | None) -> None:
+        self.remove(name)
+
+        if entry is not None:
+            self.add(name, entry)
+
+    def clear(self) -> None:
+        self.files.clear()
+        self.postings.clear()
+        self.documents.clear()
+        self.file_documents.clear()
+        self.total_length = 0
+        self.sorted_terms = None
+
+    def add(self, name: str, entry: dict) -> None:
+        self.files[name] = entry
+        self.file_documents[name] = []
+
+        for id, type, counts, length, text in entry["blocks"]:
+            document = self.next_document
+            self.next_document += 1
+
+            for term, count in counts.items():
+                self.postings.setdefault(term, {})[document] = count
+
+            self.documents[document] = (name, id, type, length, text)
+            self.file_documents[name].append(document)
+            self.total_length += length
+
+        self.sorted_terms = None
+
+    def remove(self, name: str) -> None:
+        entry = self.files.pop(name, None)
+        if entry is None:
+            return
+
+        for document, (_, _, counts, length, _) in zip(self.file_documents.pop(name), entry["blocks"]):
+            for term in counts:
+                postings = self.postings[term]
+                del postings[document]
+
+                if not postings:
+                    del self.postings[term]
+
+            del self.documents[document]
+            self.total_length -= length
+
+        self.sorted_terms = None
+
+    def put(self, name: str, records: list[st_s.Record], stat: list[int]) -> None:
+        title = ""
+        blocks = []
+
+        for id, type, content in records:
+            if type not in ("title", "text") or not isinstance(content, str):
+                continue
+
+            words = terms(content)
+            counts = {}
+            for word in words:
+                counts[word] = counts.get(word, 0) + 1
+
+            if type == "title":
+                title = content
+
+            blocks.append([id, type, counts, len(words), snippet(type, content)])
+
+        self.remove(name)
+        self.add(name, {"stat": stat, "title": title, "blocks": blocks})
+
+    def update(self, path: str, records: list[st_s.Record]) -> None:
+        """Reindexes one file from the records just saved to it."""
+
+        with self.lock:
+            self.put(basename(path), records, st_s.file_stat(path))
+            self.stored.append(basename(path), self.files)
+
+    def refresh(self) -> None:
+        """Picks up files that were added, changed or removed since they were indexed (by another session, or by hand)."""
+
+        with self.lock:
+            changed = False
+            names = {name for name in os.listdir(self.directory)
+                if is_notes(name) and os.path.isfile(join(self.directory, name))} if exists(self.directory) else set()
+
+            for name in list(self.files):
+                if name not in names:
+                    self.remove(name)
+                    changed = True
+
+            for name in names:
+                path = join(self.directory, name)
+
+                try:
+                    stat = st_s.file_stat(path)
+                    if name in self.files and self.files[name]["stat"] == stat:
+                        continue
+
+                    try:
+                        # only the manifest, images stay on disk. older (pickled) files aren't read, unpickling
+                        # runs whatever is in them, they're indexed once they're opened and saved again
+                        records = st_s.load(path)[1] if st_s.is_container(path) else []
+                    except Exception:
+                        records = [] # not notes, or broken. indexed empty so it isn't retried until it changes
+
+                    self.put(name, records, stat)
+                    changed = True
+
+                except FileNotFoundError: # removed while scanning
+                    continue
+
+            if changed:
+                self.stored.save(self.files)
+
+    def expand(self, prefix: str) -> list[str]:
+        if self.sorted_terms is None:
+            self.sorted_terms = sorted(self.postings)
+
+        start = bisect.bisect_left(self.sorted_terms, prefix)
+        matches = []
+
+        for term in self.sorted_terms[start:start + PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+
+        return matches
+
+    def search(self, query: str, limit: int = 10) -> list[Hit]:
+        """
+        Blocks containing every word of the query, best first (BM25, titles count double).
+        The last word also matches longer terms, so results show up while it's being typed.
+        """
+
+        words = terms(query)
+        if not words:
+            return []
+
+        with self.lock:
+            count = len(self.documents) or 1
+            average_length = self.total_length / count or 1
+            scores = None
+
+            for i, word in enumerate(words):
+                last = i == len(words) - 1 and not query[-1:].isspace()
+                word_scores = {}
+
+                for term in (self.expand(word) if last else [word]):
+                    postings = self.postings.get(term, {})
+                    idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+
+                    for document, tf in postings.items():
+                        _, _, type, length, _ = self.documents[document]
+                        score = idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length))
+                        score *= TITLE_BOOST if type == "title" else 1
+                        word_scores[document] = max(word_scores.get(document, 0), score)
+
+                # every word has to match
+                scores = word_scores if scores is None else {document: scores[document] + word_scores[document] for document in scores.keys() & word_scores.keys()}
+                if not scores:
+                    return []
+
+            hits = []
+            for document in heapq.nlargest(limit, scores, key=scores.get):
+                name, id, _, _, text = self.documents[document]
+                hits.append(Hit(scores[document], name, id, self.files[name]["title"], text))
+
+            return hits
+
+
+def get_index(directory: str) -> Index:
+    return st_sd.shared(Index, directory)
+
+def update(path: str, records: list[st_s.Record]) -> None:
+    """Called after a save, reindexes the notes at path."""
+
+    get_index(dirname(path)).update(path, records)
+
+def search(directory: str, query: str, limit: int = 10) -> list[Hit]:
+    return get_index(directory).search(query, limit)
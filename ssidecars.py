@@ -0,0 +1,100 @@
+from os.path import abspath, exists
+from threading import Lock
+import sstorage as st_s
+import json
+import os
+
+
+# files kept next to the notes they describe (the search index, the catalog):
+#   a snapshot, {"version", "files": {name: entry}}
+#   a journal of the entries changed since, a {"name", "entry"} json line each (entry None if the file
+#   is gone), read over the snapshot in order. it's folded into the snapshot once it's bigger than it.
+# neither is fsynced before the notes are, a lost entry is a stat that doesn't match and refresh() redoes it.
+
+_shared: dict[tuple[type, str], object] = {} # by class and directory, shared by every session
+_shared_lock = Lock()
+
+
+def shared(cls: type, directory: str):
+    """The instance of cls (made from the directory) for directory, the same for every session."""
+
+    directory = abspath(directory)
+
+    with _shared_lock:
+        if (cls, directory) not in _shared:
+            _shared[cls, directory] = cls(directory)
+
+        return _shared[cls, directory]
+
+
+class EntryFile:
+    """Snapshot at path and journal of entries by name. Not thread safe, its owner locks around it."""
+
+    def __init__(self, path: str, journal: str, version: int):
+        self.path = path
+        self.journal = journal
+        self.version = version
+        self.journal_size = 0 # bytes appended since the snapshot was last written
+
+    def load(self, apply) -> bool:
+        """
+        Calls apply(name, entry) for every entry of the snapshot, then for every journaled one (None for a file that's gone).
+        False if there's no snapshot of this version, OSError, ValueError or KeyError if it can't be read.
+        """
+
+        if not exists(self.path):
+            return False
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+
+        if stored.get("version") != self.version:
+            return False
+
+        for name, entry in stored["files"].items():
+            apply(name, entry)
+
+        self.replay(apply)
+        return True
+
+    def replay(self, apply) -> None:
+        """Applies the journaled entries. A torn last line (a crash mid append) is dropped."""
+
+        if not exists(self.journal):
+            return
+
+        with open(self.journal, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+
+                try:
+                    change = json.loads(line)
+                except ValueError:
+                    break
+
+                apply(change["name"], change["entry"])
+                self.journal_size = f.tell()
+
+        os.truncate(self.journal, self.journal_size) # so the next line doesn't follow half of one
+
+    def save(self, files: dict[str, dict]) -> None:
+        data = json.dumps({"version": self.version, "files": files}).encode()
+        st_s.write_atomic(self.path, lambda f: f.write(data))
+
+        # everything in it is in the snapshot now, replaying it again would only repeat it
+        if exists(self.journal):
+            os.remove(self.journal)
+        self.journal_size = 0
+
+    def append(self, name: str, files: dict[str, dict]) -> None:
+        """Journals the entry of one file in files, the whole of files is only written again once the journal outgrows the snapshot."""
+
+        line = json.dumps({"name": name, "entry": files.get(name)}).encode() + b"\n"
+
+        with open(self.journal, "ab") as f:
+            f.write(line)
+            self.journal_size = f.tell()
+
+        if self.journal_size > (os.path.getsize(self.path) if exists(self.path) else 0):
+            self.save(files)
@@ -0,0 +1,68 @@
+from os.path import dirname, abspath
+import subprocess
+import sys
+
+
+# startup profile, `python sstartup.py [module]` prints where the import time of the app goes.
+
+# loaded on first use, they shouldn't show up in a cold start
+LAZY = ("typst", "code_editor", "streamlit_drawable_canvas", "svgpathtools", "dill", "pandas")
+SHOWN = 15 # heaviest imports listed
+
+
+class Entry:
+    def __init__(self, name: str, depth: int, own: float, total: float):
+        self.name = name
+        self.depth = depth # 0 for what the module imports directly
+        self.own = own # seconds spent in the module itself
+        self.total = total # seconds, including everything it imported
+
+
+def profile(module: str = "snotesapp") -> list[Entry]:
+    """
+    Imports module in a fresh interpreter under -X importtime, the way a new server process would.
+    streamlit is imported first and left out, `streamlit run` has already loaded it by then.
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import streamlit; import sys; sys.stderr.write('--\\n'); import {module}"],
+        cwd=dirname(abspath(__file__)), capture_output=True, text=True
+    )
+
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    entries = []
+    for line in result.stderr.split("--\n", 1)[1].splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+
+        own, total, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append(Entry(name.strip(), depth, int(own) / 1e6, int(total) / 1e6))
+
+    return entries
+
+def report(entries: list[Entry], module: str = "snotesapp") -> str:
+    app = next((entry for entry in entries if entry.name == module and entry.depth == 0), None)
+    lines = [f"{module} imports in {app.total * 1000:.0f}ms" if app else f"{module} wasn't imported", ""]
+
+    # what the app imports directly (depth 1, under the app itself), heaviest first
+    lines.append("by module:")
+    for entry in sorted((entry for entry in entries if entry.depth == 1), key=lambda entry: entry.total, reverse=True)[:SHOWN]:
+        lines.append(f"  {entry.total * 1000:8.1f}ms  {entry.name}")
+
+    lines += ["", "heaviest overall (own time):"]
+    for entry in sorted(entries, key=lambda entry: entry.own, reverse=True)[:SHOWN]:
+        lines.append(f"  {entry.own * 1000:8.1f}ms  {entry.name}")
+
+    loaded = {entry.name.split(".")[0] for entry in entries}
+    eager = [name for name in LAZY if name in loaded]
+    lines += ["", f"loaded eagerly, should be lazy: {', '.join(eager)}" if eager else "lazy modules: none loaded at startup"]
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    module = sys.argv[1] if len(sys.argv) > 1 else "snotesapp"
+    print(report(profile(module), module))
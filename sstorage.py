@@ -0,0 +1,378 @@
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED, is_zipfile
+from os.path import dirname, basename, join
+from simages import CompactImage
+from threading import Lock
+from typing import Any
+import numpy as np
+import struct
+import zlib
+import uuid
+import json
+import io
+import os
+
+
+# .notes container, version 2:
+#   manifest.json       -> {"format", "version", "block_id", "blocks": [{"id", "type", ...}]}
+#   blocks/<id>.png     -> cropped image of block <id> (only for non blank image blocks)
+#   blocks/<id>.json    -> the canvas objects it was drawn with, if they were kept (for vector pdfs)
+# text and title blocks live in the manifest itself, so opening a notebook only
+# parses one small json entry. image blocks keep their shape and bounding box in the
+# manifest, their png is read when it's first used.
+# the zip comment holds the snapshot's generation, which ties it to its journal.
+# version 1 stored whole .npy arrays in blocks/<id>.npy, they're converted when loaded.
+#
+# .<name>.journal, next to the snapshot:
+#   b"SNJ2" + generation (16 bytes)
+#   records: header length, payload length (<II), json header, payload, crc32 (<I)
+#   each record holds the new block order plus the blocks that changed since the last save.
+#   image pngs (and their canvas objects) are referenced by [offset, length] inside the payload.
+# b"SNJ1" journals (version 1) held zlib compressed .npy bytes instead.
+
+FORMAT = "snotes"
+FORMAT_VERSION = 2
+MANIFEST = "manifest.json"
+
+JOURNAL_MAGIC = b"SNJ2"
+LEGACY_JOURNAL_MAGIC = b"SNJ1"
+JOURNAL_COMPACT_BYTES = 8 * 1024 * 1024 # compact once the journal is bigger than this (or than the snapshot)
+RECORD_HEADER = struct.Struct("<II")
+RECORD_CRC = struct.Struct("<I")
+
+Record = tuple[int, str, Any] # (id, type, content)
+
+
+class LazyPayload:
+    """
+    Reference to an image payload stored in a .notes container, read the first time it's needed.
+    entry is either the name of a zip entry or an (offset, length) slice of a journal file.
+    """
+
+    def __init__(self, path: str, entry: str | tuple[int, int], compressed: bool = False):
+        self.path = path
+        self.entry = entry
+        self.compressed = compressed # zlib on top, only for version 1 journals
+        self.lock = Lock() # the path may be rebound by a save while a render reads it
+
+    def read(self) -> bytes:
+        with self.lock:
+            if isinstance(self.entry, str):
+                with ZipFile(self.path, "r") as zf:
+                    return zf.read(self.entry)
+
+            offset, length = self.entry
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                data = f.read(length)
+
+            return zlib.decompress(data) if self.compressed else data
+
+    def load(self) -> np.ndarray:
+        """Decodes a version 1 (.npy) payload."""
+
+        return np.load(io.BytesIO(self.read()), allow_pickle=False)
+
+    def rebind(self, path: str, entry: str | tuple[int, int]) -> None:
+        with self.lock:
+            self.path = path
+            self.entry = entry
+            self.compressed = False
+
+
+def compact(content: Any) -> CompactImage | None:
+    """Image content as a CompactImage, converting what older versions stored (whole arrays, .npy payloads)."""
+
+    if isinstance(content, LazyPayload):
+        content = content.load()
+
+    if isinstance(content, np.ndarray):
+        content = CompactImage.from_array(content)
+
+    return content
+
+def image_entry(id: int) -> str:
+    return f"blocks/{id}.png"
+
+def vectors_entry(id: int) -> str:
+    return f"blocks/{id}.json"
+
+def image_fields(image: CompactImage) -> dict:
+    return {"shape": list(image.shape), "bbox": list(image.bbox) if image.bbox else None}
+
+def read_image(fields: dict, payload: LazyPayload | None, vectors: LazyPayload | None = None) -> CompactImage:
+    return CompactImage(fields["shape"], fields["bbox"], payload, vectors)
+
+
+def journal_path(path: str) -> str:
+    return join(dirname(path), f".{basename(path)}.journal")
+
+def is_container(path: str) -> bool:
+    return is_zipfile(path)
+
+def file_stat(path: str) -> list[int]:
+    """(mtime, size) of a notes file and of its journal, if it has one. Changes whenever either is written."""
+
+    journal = journal_path(path)
+    stats = [os.stat(path)] + ([os.stat(journal)] if os.path.exists(journal) else [])
+    return [value for stat in stats for value in (stat.st_mtime_ns, stat.st_size)]
+
+def generation(path: str) -> bytes | None:
+    """Generation of the snapshot at path, None if there's no usable snapshot there."""
+
+    if not os.path.exists(path) or not is_container(path):
+        return None
+
+    with ZipFile(path, "r") as zf:
+        return bytes.fromhex(zf.comment.decode()) if zf.comment else None
+
+def write_atomic(path: str, write) -> None:
+    """Calls write(file) on a temporary file next to path, then moves it over path."""
+
+    temp = join(dirname(path), f".{basename(path)}.tmp")
+
+    try:
+        with open(temp, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+def save(path: str, block_id: int, records: list[Record]) -> None:
+    """Writes a notebook as a .notes snapshot, dropping its journal. Unloaded pngs are copied over as they are."""
+
+    manifest = {"format": FORMAT, "version": FORMAT_VERSION, "block_id": block_id, "blocks": []}
+    lazy = []
+
+    def write(f):
+        with ZipFile(f, "w", compression=ZIP_DEFLATED, compresslevel=1) as zf:
+            zf.comment = uuid.uuid4().hex.encode()
+
+            for id, type, content in records:
+                if type != "image":
+                    manifest["blocks"].append({"id": id, "type": type, "content": content})
+                    continue
+
+                image = compact(content)
+                if image is None:
+                    manifest["blocks"].append({"id": id, "type": type, "payload": None})
+                    continue
+
+                entry = image_entry(id) if image.bbox is not None else None
+                vectors = vectors_entry(id) if image.bbox is not None and image.vectors is not None else None
+                manifest["blocks"].append({"id": id, "type": type, "payload": entry, **image_fields(image)})
+
+                if entry is not None:
+                    zf.writestr(entry, image.png(), compress_type=ZIP_STORED) # already compressed
+
+                    if isinstance(image.data, LazyPayload):
+                        lazy.append((image.data, entry))
+
+                if vectors is not None:
+                    manifest["blocks"][-1]["vectors"] = vectors
+                    zf.writestr(vectors, image.vector_json())
+
+                    if isinstance(image.vectors, LazyPayload):
+                        lazy.append((image.vectors, vectors))
+
+            # the manifest goes last so a partially written file is never mistaken for a valid one
+            zf.writestr(MANIFEST, json.dumps(manifest))
+
+    write_atomic(path, write)
+
+    # payloads that were never loaded now have to be read from the new file
+    for payload, entry in lazy:
+        payload.rebind(path, entry)
+
+    # the old journal belongs to the old generation, everything in it is in the new snapshot now
+    if os.path.exists(journal_path(path)):
+        os.remove(journal_path(path))
+
+def append(path: str, block_id: int, records: list[Record], changed: set[int]) -> None:
+    """
+    Appends the blocks in changed (by id) to the journal of the snapshot at path.
+    Falls back to a full snapshot if there's none, and compacts the journal once it grows too big.
+    """
+
+    snapshot_generation = generation(path)
+    if snapshot_generation is None:
+        return save(path, block_id, records)
+
+    journal = journal_path(path)
+    if os.path.exists(journal):
+        with open(journal, "rb") as f:
+            # stale (a crash mid compaction) or written by an older version
+            if f.read(4 + 16) != JOURNAL_MAGIC + snapshot_generation:
+                return save(path, block_id, records)
+
+    header = {"block_id": block_id, "order": [id for id, _, _ in records], "blocks": []}
+    payload = io.BytesIO()
+    lazy = []
+
+    for id, type, content in records:
+        if id not in changed:
+            continue
+
+        if type != "image":
+            header["blocks"].append({"id": id, "type": type, "content": content})
+            continue
+
+        image = compact(content)
+        if image is None:
+            header["blocks"].append({"id": id, "type": type, "content": None})
+            continue
+
+        if image.bbox is None:
+            header["blocks"].append({"id": id, "type": type, "payload": None, **image_fields(image)})
+            continue
+
+        data = image.png()
+        if isinstance(image.data, LazyPayload):
+            lazy.append((image.data, payload.tell(), len(data)))
+
+        header["blocks"].append({"id": id, "type": type, "payload": [payload.tell(), len(data)], **image_fields(image)})
+        payload.write(data)
+
+        if image.vectors is not None:
+            vectors = image.vector_json()
+            if isinstance(image.vectors, LazyPayload):
+                lazy.append((image.vectors, payload.tell(), len(vectors)))
+
+            header["blocks"][-1]["vectors"] = [payload.tell(), len(vectors)]
+            payload.write(vectors)
+
+    header = json.dumps(header).encode()
+    payload = payload.getvalue()
+
+    with open(journal, "ab") as f:
+        if f.tell() == 0:
+            f.write(JOURNAL_MAGIC + snapshot_generation)
+
+        end = f.tell()
+        start = end + RECORD_HEADER.size + len(header)
+
+        try:
+            f.write(RECORD_HEADER.pack(len(header), len(payload)) + header + payload)
+            f.write(RECORD_CRC.pack(zlib.crc32(header + payload)))
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.truncate(end) # don't leave half a record for the next append to follow
+            raise
+
+        size = f.tell()
+
+    for content, offset, length in lazy:
+        content.rebind(journal, (start + offset, length))
+
+    if size > max(JOURNAL_COMPACT_BYTES, os.path.getsize(path)):
+        save(path, block_id, records)
+
+def replay(path: str, snapshot_generation: bytes, blocks: dict[int, Record], order: list[int]) -> int | None:
+    """
+    Applies the journal of the snapshot at path over blocks and order, in place.
+    Returns the last journaled block_id, None if there's nothing to replay.
+    A truncated or corrupt tail (a crash mid append) is cut off so later appends stay readable.
+    """
+
+    journal = journal_path(path)
+    if not os.path.exists(journal):
+        return None
+
+    block_id = None
+
+    with open(journal, "rb") as f:
+        magic = f.read(4)
+        if magic not in (JOURNAL_MAGIC, LEGACY_JOURNAL_MAGIC) or f.read(16) != snapshot_generation:
+            return None
+
+        while True:
+            start = f.tell()
+            sizes = f.read(RECORD_HEADER.size)
+            if len(sizes) < RECORD_HEADER.size:
+                break
+
+            header_length, payload_length = RECORD_HEADER.unpack(sizes)
+            data = f.read(header_length + payload_length)
+            crc = f.read(RECORD_CRC.size)
+            if len(crc) < RECORD_CRC.size or RECORD_CRC.unpack(crc)[0] != zlib.crc32(data):
+                break
+
+            header = json.loads(data[:header_length])
+            payload_start = start + RECORD_HEADER.size + header_length
+
+            for block in header["blocks"]:
+                content = block.get("content")
+                vectors = None
+
+                if block.get("payload") is not None:
+                    offset, length = block["payload"]
+                    content = LazyPayload(journal, (payload_start + offset, length), compressed=magic == LEGACY_JOURNAL_MAGIC)
+
+                if block.get("vectors") is not None:
+                    offset, length = block["vectors"]
+                    vectors = LazyPayload(journal, (payload_start + offset, length))
+
+                if "shape" in block:
+                    content = read_image(block, content, vectors)
+
+                blocks[block["id"]] = (block["id"], block["type"], content)
+
+            order[:] = header["order"]
+            block_id = header["block_id"]
+
+    if start < os.path.getsize(journal):
+        os.truncate(journal, start)
+
+    return block_id
+
+def load(path: str) -> tuple[int, list[Record]]:
+    """Reads the manifest of a .notes file. Images come back with their pngs still on disk."""
+
+    if not is_container(path):
+        return load_legacy(path)
+
+    with ZipFile(path, "r") as zf:
+        manifest = json.loads(zf.read(MANIFEST))
+        snapshot_generation = bytes.fromhex(zf.comment.decode()) if zf.comment else None
+
+    assert manifest.get("format") == FORMAT, "not a snotes file"
+    assert manifest["version"] <= FORMAT_VERSION, "this file was written by a newer version of snotesapp"
+
+    blocks = {}
+    for block in manifest["blocks"]:
+        if block["type"] != "image":
+            content = block["content"]
+        elif "shape" in block:
+            content = read_image(block, LazyPayload(path, block["payload"]) if block["payload"] else None,
+                LazyPayload(path, block["vectors"]) if block.get("vectors") else None)
+        else: # version 1, a whole .npy array
+            content = LazyPayload(path, block["payload"]) if block["payload"] else None
+
+        blocks[block["id"]] = (block["id"], block["type"], content)
+
+    order = [block["id"] for block in manifest["blocks"]]
+    block_id = manifest["block_id"]
+
+    if snapshot_generation is not None:
+        journaled_block_id = replay(path, snapshot_generation, blocks, order)
+        if journaled_block_id is not None:
+            block_id = journaled_block_id
+
+    return block_id, [blocks[id] for id in order]
+
+def load_legacy(path: str) -> tuple[int, list[Record]]:
+    """Migration path for files written before the container format (a dill pickle of the whole App)."""
+
+    import dill # only needed for old files
+
+    with open(path, "rb") as f:
+        loaded_app = dill.load(f)
+
+    # vars() because the pickled blocks keep content in their __dict__
+    records = [(block.id, block.type, vars(block)["content"]) for block in loaded_app.blocks]
+
+    return loaded_app.block_id, records
@@ -0,0 +1,156 @@
+from os.path import join, exists, expanduser, getmtime
+from threading import Lock, local
+import tempfile
+import platform
+import shutil
+import sys
+import os
+import re
+
+
+# long lived typst compilers, shared by every session (and by every compile of sexport's workers).
+# fonts are loaded once, packages are read from the vendored ./packages/ (<namespace>/<name>/<version>,
+# the layout of typst's own package cache) so compiles work without network access.
+# `python stypst.py check` tells whether every package the template imports resolves offline,
+# `python stypst.py vendor` copies them there from typst's cache, or downloads them.
+
+TEMPLATE_PATH = "./template.typ"
+PACKAGES_DIR = "./packages/"
+FONTS_DIR = "./fonts/" # extra fonts, optional
+
+PACKAGE_IMPORT = re.compile(r'#import\s+"@([\w-]+)/([\w-]+):([\w.-]+)"')
+
+_template = None # (mtime, text)
+_fonts = None
+_lock = Lock()
+_compilers = local() # a typst.Compiler can't run two compiles at once, each compile worker has its own
+
+
+def template() -> str:
+    """template.typ, read again only when it changes."""
+
+    global _template
+
+    with _lock:
+        mtime = getmtime(TEMPLATE_PATH)
+
+        if _template is None or _template[0] != mtime:
+            with open(TEMPLATE_PATH, "r", encoding="utf-8") as f:
+                _template = (mtime, f.read())
+
+        return _template[1]
+
+def packages(source: str | None = None) -> list[tuple[str, str, str]]:
+    """(namespace, name, version) of every package source (the template by default) imports."""
+
+    return PACKAGE_IMPORT.findall(template() if source is None else source)
+
+def package_dir(root: str, package: tuple[str, str, str]) -> str:
+    return join(root, *package)
+
+def typst_cache() -> str:
+    """Where the typst cli and typst-py download packages to by default."""
+
+    match platform.system():
+        case "Windows":
+            base = os.environ.get("LOCALAPPDATA", expanduser("~/AppData/Local"))
+        case "Darwin":
+            base = expanduser("~/Library/Caches")
+        case _:
+            base = os.environ.get("XDG_CACHE_HOME", expanduser("~/.cache"))
+
+    return join(base, "typst", "packages")
+
+
+def get_fonts():
+    global _fonts
+
+    import typst # loaded with the first compile, not at startup
+
+    with _lock:
+        if _fonts is None:
+            _fonts = typst.Fonts(include_system_fonts=True, include_embedded_fonts=True,
+                font_paths=[FONTS_DIR] if exists(FONTS_DIR) else [])
+
+        return _fonts
+
+def new_compiler(package_cache_path: str | None = None):
+    import typst
+
+    return typst.Compiler(root=".", font_paths=get_fonts(), package_path=PACKAGES_DIR if exists(PACKAGES_DIR) else None,
+        package_cache_path=package_cache_path)
+
+def get_compiler():
+    """This thread's compiler, it keeps what typst already evaluated (the packages, the template) between compiles."""
+
+    if getattr(_compilers, "compiler", None) is None:
+        _compilers.compiler = new_compiler()
+
+    return _compilers.compiler
+
+def compile(source: str) -> bytes:
+    return get_compiler().compile(source.encode(), format="pdf")
+
+
+def probe(imports: list[tuple[str, str, str]]) -> str:
+    return "\n".join(f'#import "@{namespace}/{name}:{version}"' for namespace, name, version in imports)
+
+def check() -> dict[str, str | None]:
+    """
+    Whether every package the template imports resolves from the vendored directory alone.
+    Returns the problem per package, None for the ones that are fine.
+    """
+
+    problems = {}
+
+    with tempfile.TemporaryDirectory() as cache: # empty, anything typst needs to put there wasn't vendored
+        compiler = new_compiler(package_cache_path=cache)
+
+        for package in packages():
+            name = "@{}/{}:{}".format(*package)
+
+            if not exists(package_dir(PACKAGES_DIR, package)):
+                problems[name] = f"not in {PACKAGES_DIR}"
+                continue
+
+            try:
+                compiler.compile(probe([package]).encode(), format="pdf")
+                problems[name] = "downloaded, the vendored copy is incomplete" if os.listdir(cache) else None
+            except Exception as e:
+                problems[name] = str(e)
+
+    return problems
+
+def vendor() -> None:
+    """Copies the template's packages into the vendored directory, from typst's cache or the network."""
+
+    for package in packages():
+        target = package_dir(PACKAGES_DIR, package)
+        cached = package_dir(typst_cache(), package)
+
+        if exists(target):
+            print(f"  @{'/'.join(package[:2])}:{package[2]} already vendored")
+        elif exists(cached):
+            shutil.copytree(cached, target)
+            print(f"  @{'/'.join(package[:2])}:{package[2]} copied from {cached}")
+        else:
+            new_compiler(package_cache_path=PACKAGES_DIR).compile(probe([package]).encode(), format="pdf") # downloads it there
+            print(f"  @{'/'.join(package[:2])}:{package[2]} downloaded")
+
+
+if __name__ == "__main__":
+    match sys.argv[1:]:
+        case ["vendor"]:
+            vendor()
+
+        case ["check"] | []:
+            problems = check()
+
+            for name, problem in problems.items():
+                print(f"  {name:<30} {problem or 'ok'}")
+
+            sys.exit(1 if any(problems.values()) else 0)
+
+        case _:
+            print("usage: python stypst.py [check | vendor]")
+            sys.exit(2)
@@ -0,0 +1,138 @@
+import math
+import re
+
+
+# canvas objects (fabric.js json, as streamlit-drawable-canvas returns them) to svg.
+# only what drawing them needs is kept, see compact(). positions follow the canvas' tools:
+# paths are in canvas coordinates, lines are centered on (left, top), rects start at it,
+# circles are centered on it (points) or have it on their edge at angle (the circle tool).
+
+KEPT = ("type", "left", "top", "width", "height", "x1", "y1", "x2", "y2", "radius", "angle", "originX", "originY",
+    "path", "stroke", "strokeWidth", "fill", "opacity", "strokeLineCap")
+DRAWN = ("path", "line", "rect", "circle")
+DECIMALS = 1 # a tenth of a canvas pixel
+
+HEX_COLOR = re.compile(r"#([0-9a-fA-F]{3,8})")
+RGB_COLOR = re.compile(r"rgba?\(\s*([\d.]+)\s*,\s*([\d.]+)\s*,\s*([\d.]+)\s*(?:,\s*([\d.]+)\s*)?\)")
+
+
+def number(value: float) -> str:
+    text = f"{value:.{DECIMALS}f}".rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+def compact(objects: list[dict]) -> list[dict]:
+    """The objects with only the fields that change how they look, coordinates rounded."""
+
+    def round_all(value):
+        if isinstance(value, float):
+            return round(value, DECIMALS)
+        if isinstance(value, list):
+            return [round_all(item) for item in value]
+        return value
+
+    return [{key: round_all(obj[key]) for key in KEPT if obj.get(key) is not None} for obj in objects]
+
+def drawable(objects: list[dict]) -> bool:
+    """Whether every object can be drawn as vectors, if not the drawing goes as pixels."""
+
+    return all(obj["type"] in DRAWN for obj in objects)
+
+
+def parse_color(color: str | None) -> tuple[float, float, float, float] | None:
+    """(r, g, b, alpha) of a css color, None for anything else (named colors, transparent, none)."""
+
+    if not color:
+        return None
+
+    if match := HEX_COLOR.fullmatch(color.strip()):
+        digits = match.group(1)
+        if len(digits) in (3, 4):
+            digits = "".join(c * 2 for c in digits)
+        if len(digits) not in (6, 8):
+            return None
+
+        values = [int(digits[i:i + 2], 16) for i in range(0, len(digits), 2)]
+        return (*values[:3], values[3] / 255 if len(values) == 4 else 1.0)
+
+    if match := RGB_COLOR.fullmatch(color.strip()):
+        r, g, b, alpha = match.groups()
+        return float(r), float(g), float(b), float(alpha) if alpha is not None else 1.0
+
+    return None
+
+def format_color(color: str | None, invert: bool) -> str:
+    parsed = parse_color(color)
+    if parsed is None:
+        return color or "none"
+
+    r, g, b, alpha = parsed
+    if invert:
+        r, g, b = 255 - r, 255 - g, 255 - b
+
+    hex = f"#{round(r):02x}{round(g):02x}{round(b):02x}"
+    return hex if alpha >= 1 else f"{hex}{round(alpha * 255):02x}"
+
+def is_light(objects: list[dict]) -> bool:
+    """
+    Same rule as sprinting.invert_if_light for pixels: drawings made with light colors (the canvas is dark)
+    are inverted so they show on paper. Here the colors of the objects are averaged instead of their pixels.
+    """
+
+    luminances = []
+    for obj in objects:
+        for color in (obj.get("stroke"), obj.get("fill")):
+            parsed = parse_color(color)
+            if parsed is not None and parsed[3] > 0:
+                r, g, b, _ = parsed
+                luminances.append(0.299 * r + 0.587 * g + 0.114 * b)
+
+    return bool(luminances) and sum(luminances) / len(luminances) > 127
+
+
+def element(obj: dict, invert: bool) -> str:
+    stroke = format_color(obj.get("stroke"), invert)
+    fill = format_color(obj.get("fill"), invert) if obj["type"] != "line" else "none"
+    style = f"stroke='{stroke}' stroke-width='{number(obj.get('strokeWidth', 1))}' fill='{fill}'"
+
+    if obj.get("opacity", 1) != 1:
+        style += f" opacity='{number(obj['opacity'])}'"
+    if obj.get("strokeLineCap", "round") != "round":
+        style += f" stroke-linecap='{obj['strokeLineCap']}'"
+
+    match obj["type"]:
+        case "path":
+            d = "".join(command[0] + " ".join(number(value) for value in command[1:]) for command in obj["path"])
+            return f"<path d='{d}' {style}/>"
+
+        case "line":
+            x, y = obj["left"], obj["top"]
+            return (f"<line x1='{number(x + obj['x1'])}' y1='{number(y + obj['y1'])}' "
+                f"x2='{number(x + obj['x2'])}' y2='{number(y + obj['y2'])}' {style}/>")
+
+        case "rect":
+            return (f"<rect x='{number(obj['left'])}' y='{number(obj['top'])}' width='{number(obj['width'])}' "
+                f"height='{number(obj['height'])}' {style}/>")
+
+        case "circle":
+            r = obj["radius"]
+
+            if obj.get("originX") == "center":
+                cx, cy = obj["left"], obj["top"]
+            else:
+                angle = obj.get("angle", 0) * math.pi / 180
+                cx, cy = obj["left"] + r * math.cos(angle), obj["top"] + r * math.sin(angle)
+
+            return f"<circle cx='{number(cx)}' cy='{number(cy)}' r='{number(r)}' {style}/>"
+
+def to_svg(objects: list[dict], width: int, height: int, invert: bool | None = None) -> str:
+    """
+    Svg of the objects on a canvas of width x height. invert remaps every color to its opposite,
+    by default it's done for light drawings (see is_light). Quotes are single, it goes inside typst strings.
+    """
+
+    if invert is None:
+        invert = is_light(objects)
+
+    body = "".join(element(obj, invert) for obj in objects)
+    return (f"<svg xmlns='http://www.w3.org/2000/svg' width='{width}' height='{height}' viewBox='0 0 {width} {height}'>"
+        f"<g stroke-linecap='round' stroke-linejoin='round'>{body}</g></svg>")
@@ -0,0 +1,466 @@
+from os.path import join, basename, dirname, exists, getmtime, getsize
+from simages import CompactImage
+from collections import OrderedDict
+from threading import Lock
+from sconfig import SECRETS
+import ssidecars as st_sd
+import sstorage as st_s
+import argparse
+import difflib
+import hashlib
+import json
+import time
+import zlib
+import sys
+import os
+
+
+# version history of every notebook in a directory, `python sversions.py --help`.
+#
+# <data_dir>/.versions/
+#   objects/<2>/<38>        -> what blocks hold, stored once by content hash: the json of a text or title
+#                              block by its sha1, a drawing's png by its CompactImage digest
+#   objects/<2>/<38>.json   -> the canvas objects of that drawing, if it kept them
+#   objects/<2>/<38>.chunk  -> zlib compressed json of a run of blocks, by its sha1:
+#                              [{"id", "type", "content"} | {"id", "type", "drawing", "vectors", "shape", "bbox"}]
+#   notes/<name>/<ms>-<id>.json
+#       -> {"version", "name", "time", "block_id", "restored", "chunks": [...]}, one per save
+# the blocks are cut into chunks where the hash of a block says so (CHUNK_BLOCKS of them on average),
+# so an edit, an insertion or a removal only makes a new chunk around it, the others stay the same.
+# id is a hash of the chunks, a save that changed nothing doesn't add a version. what didn't change
+# between versions (and drawings that appear in several notebooks) points to the same objects, so
+# a version costs its manifest plus whatever changed. objects nothing points to anymore (see prune)
+# are removed by gc.
+
+STORE_NAME = ".versions"
+STORE_VERSION = 1
+CHUNK_BLOCKS = 32
+CHUNK_CACHE = 1024 # chunks kept parsed, listing versions reads the same ones over and over
+GC_GRACE = 60 * 60 # in seconds, objects younger than this are kept, a save may be about to write the manifest using them
+
+
+def sha1(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+class Blob:
+    """An object of the store, read on demand (like sstorage.LazyPayload). Objects never change once written."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+class Version:
+    def __init__(self, path: str, manifest: dict, blocks: list[dict]):
+        self.path = path
+        self.id = basename(path).removesuffix(".json").split("-", 1)[1]
+        self.name = manifest["name"]
+        self.time = manifest["time"]
+        self.block_id = manifest["block_id"]
+        self.restored = manifest.get("restored") # id of the version it was restored from
+        self.chunks: list[str] = manifest["chunks"]
+        self.blocks = blocks # what its chunks hold, in order
+
+
+class Change:
+    """A block that differs between two versions. lines is a unified diff, for text and titles."""
+
+    def __init__(self, kind: str, id: int, type: str, lines: list[str] | None = None):
+        self.kind = kind # "added", "removed", "changed" or "moved"
+        self.id = id
+        self.type = type
+        self.lines = lines or []
+
+
+class Store:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.root = join(directory, STORE_NAME)
+        self.lock = Lock()
+        self.latest: dict[str, str] = {} # name -> id of its newest version
+        self.parsed: "OrderedDict[str, list[dict]]" = OrderedDict() # chunk hash -> its blocks
+
+    def object_path(self, hash: str, suffix: str = "") -> str:
+        return join(self.root, "objects", hash[:2], hash[2:] + suffix)
+
+    def notes_dir(self, name: str) -> str:
+        return join(self.root, "notes", name)
+
+    def put(self, hash: str, data, suffix: str = "") -> str:
+        """Stores data (bytes, or a function returning them, only called if it's not there yet) as the object hash."""
+
+        path = self.object_path(hash, suffix)
+
+        try:
+            os.utime(path) # freshened, gc (maybe in another process) leaves it alone until the version points to it
+        except FileNotFoundError:
+            os.makedirs(dirname(path), exist_ok=True)
+            data = data() if callable(data) else data
+            st_s.write_atomic(path, lambda f: f.write(data))
+
+        return hash
+
+    def entry(self, record: st_s.Record, write: bool = True) -> dict:
+        """What a version keeps of a block, its contents go to the objects (when write is set)."""
+
+        id, type, content = record
+
+        if type != "image":
+            data = json.dumps(content).encode()
+            return {"id": id, "type": type, "content": self.put(sha1(data), data) if write else sha1(data)}
+
+        image = st_s.compact(content)
+        if image is None:
+            return {"id": id, "type": type, "drawing": None}
+
+        entry = {"id": id, "type": type, "drawing": None, "vectors": False, **st_s.image_fields(image)}
+
+        if image.bbox is not None:
+            entry["drawing"] = image.digest()
+            entry["vectors"] = image.vectors is not None
+
+            if write:
+                self.put(entry["drawing"], image.png)
+                if image.vectors is not None:
+                    self.put(entry["drawing"], image.vector_json, ".json")
+
+        return entry
+
+    def chunk(self, blocks: list[dict]) -> str:
+        data = zlib.compress(json.dumps(blocks, separators=(",", ":")).encode())
+        hash = self.put(sha1(data), data, ".chunk")
+
+        self.remember(hash, blocks)
+        return hash
+
+    def remember(self, hash: str, blocks: list[dict]) -> None:
+        self.parsed[hash] = blocks
+        self.parsed.move_to_end(hash)
+
+        while len(self.parsed) > CHUNK_CACHE:
+            self.parsed.popitem(last=False)
+
+    def read_chunk(self, hash: str) -> list[dict]:
+        if hash in self.parsed:
+            self.parsed.move_to_end(hash)
+            return self.parsed[hash]
+
+        with open(self.object_path(hash, ".chunk"), "rb") as f:
+            blocks = json.loads(zlib.decompress(f.read()))
+
+        self.remember(hash, blocks)
+        return blocks
+
+    def record(self, name: str, block_id: int, records: list[st_s.Record], restored: str | None = None) -> Version | None:
+        """Adds a version of the notes called name, None if they're the same as its newest one."""
+
+        with self.lock:
+            blocks = [self.entry(record) for record in records]
+            chunks, start = [], 0
+
+            for i, block in enumerate(blocks):
+                hash = block.get("content") or block.get("drawing") or sha1(str(block["id"]).encode()) # blank drawings
+                if int(hash[:8], 16) % CHUNK_BLOCKS == 0 or i == len(blocks) - 1:
+                    chunks.append(self.chunk(blocks[start:i + 1]))
+                    start = i + 1
+
+            id = sha1(json.dumps({"block_id": block_id, "chunks": chunks}).encode())[:16]
+
+            if name not in self.latest:
+                versions = self.version_files(name)
+                self.latest[name] = versions[-1].removesuffix(".json").split("-", 1)[1] if versions else None
+
+            if self.latest[name] == id:
+                return None
+
+            now = time.time()
+            manifest = {"version": STORE_VERSION, "name": name, "time": now, "block_id": block_id, "restored": restored, "chunks": chunks}
+            path = join(self.notes_dir(name), f"{int(now * 1000):013d}-{id}.json")
+            data = json.dumps(manifest).encode()
+
+            os.makedirs(self.notes_dir(name), exist_ok=True)
+            st_s.write_atomic(path, lambda f: f.write(data)) # after its objects, a version never points to missing ones
+            self.latest[name] = id
+
+            return Version(path, manifest, blocks)
+
+    def version_files(self, name: str) -> list[str]:
+        directory = self.notes_dir(name)
+        if not exists(directory):
+            return []
+
+        return sorted(file for file in os.listdir(directory) if file.endswith(".json") and not file.startswith("."))
+
+    def versions(self, name: str) -> list[Version]:
+        """Every version of the notes called name, oldest first."""
+
+        versions = []
+        for file in self.version_files(name):
+            with open(join(self.notes_dir(name), file), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+
+            blocks = [block for hash in manifest["chunks"] for block in self.read_chunk(hash)]
+            versions.append(Version(join(self.notes_dir(name), file), manifest, blocks))
+
+        return versions
+
+    def find(self, name: str, ref: str) -> Version:
+        """
+        The ref-th version (1 is the oldest, -1 the newest) if ref is a number of up to three digits,
+        otherwise the one whose id starts with ref.
+        """
+
+        versions = self.versions(name)
+
+        if ref.lstrip("-").isdigit() and len(ref.lstrip("-")) <= 3 and int(ref) != 0:
+            index = int(ref)
+            if -len(versions) <= index <= len(versions):
+                return versions[index - 1 if index > 0 else index]
+
+        matches = [version for version in versions if version.id.startswith(ref)]
+        if not matches:
+            raise KeyError(f"{name} has no version {ref}")
+
+        return matches[-1] # the same blocks saved again later, the newest time they were
+
+    def records(self, version: Version) -> list[st_s.Record]:
+        """The blocks of a version, drawings are read from the objects when they're used."""
+
+        records = []
+        for block in version.blocks:
+            if block["type"] != "image":
+                with open(self.object_path(block["content"]), "rb") as f:
+                    content = json.loads(f.read())
+            elif "shape" not in block:
+                content = None
+            else:
+                drawing = block["drawing"]
+                content = CompactImage(block["shape"], block["bbox"], Blob(self.object_path(drawing)) if drawing else None,
+                    Blob(self.object_path(drawing, ".json")) if drawing and block["vectors"] else None)
+
+            records.append((block["id"], block["type"], content))
+
+        return records
+
+    def restore(self, path: str, ref: str) -> Version:
+        """
+        Writes a version of the notes at path over them. The restored notes are a version of their own.
+        For the command line, the app hands the records to its saver instead (it may be writing the same file).
+        """
+
+        version = self.find(basename(path), ref)
+        records = self.records(version)
+
+        st_s.save(path, version.block_id, records)
+        self.record(basename(path), version.block_id, records, restored=version.id)
+
+        return version
+
+    def diff(self, old: Version | None, new: Version | list[st_s.Record], lines: bool = True) -> list[Change]:
+        """
+        What changed from old to new (a version, or the blocks of the notes as they are now), block by block.
+        Changed text comes with a diff of its lines, unless lines is off.
+        """
+
+        new_blocks = new.blocks if isinstance(new, Version) else [self.entry(record, write=False) for record in new]
+        current = {} if isinstance(new, Version) else {id: content for id, type, content in new if type != "image"}
+
+        old_blocks = {block["id"]: block for block in (old.blocks if old is not None else [])}
+        new_ids = {block["id"] for block in new_blocks}
+        changes = []
+
+        def text(block) -> str:
+            with open(self.object_path(block["content"]), "rb") as f:
+                return json.loads(f.read()) or ""
+
+        for block in new_blocks:
+            before = old_blocks.get(block["id"])
+
+            if before is None:
+                changes.append(Change("added", block["id"], block["type"]))
+            elif before != block:
+                diff = None
+                if lines and block["type"] != "image" and before["type"] != "image":
+                    after = current[block["id"]] or "" if block["id"] in current else text(block)
+                    diff = list(difflib.unified_diff(text(before).splitlines(), after.splitlines(), lineterm="", n=1))[2:]
+
+                changes.append(Change("changed", block["id"], block["type"], diff))
+
+        for id, block in old_blocks.items():
+            if id not in new_ids:
+                changes.append(Change("removed", id, block["type"]))
+
+        # blocks that are in both and aren't in the longest run that kept its order were moved
+        positions = {id: i for i, id in enumerate(old_blocks)}
+        common = [block for block in new_blocks if block["id"] in positions]
+        for block in [block for i, block in enumerate(common) if i not in in_order([positions[block["id"]] for block in common])]:
+            changes.append(Change("moved", block["id"], block["type"]))
+
+        return changes
+
+    def prune(self, name: str, keep: int) -> int:
+        """Drops all but the newest keep versions of the notes called name, returns how many were dropped."""
+
+        with self.lock:
+            files = self.version_files(name)
+            dropped = files[:max(len(files) - keep, 0)]
+
+            for file in dropped:
+                os.remove(join(self.notes_dir(name), file))
+
+            return len(dropped)
+
+    def gc(self, grace: float = GC_GRACE) -> tuple[int, int]:
+        """Removes the objects no version points to, returns how many and their size."""
+
+        with self.lock:
+            referenced = set()
+            notes = join(self.root, "notes")
+
+            for name in os.listdir(notes) if exists(notes) else []:
+                for version in self.versions(name):
+                    referenced.update(version.chunks)
+
+                    for block in version.blocks:
+                        referenced.add(block.get("content") if block["type"] != "image" else block.get("drawing"))
+
+            removed, freed = 0, 0
+            objects = join(self.root, "objects")
+
+            for prefix in os.listdir(objects) if exists(objects) else []:
+                for file in os.listdir(join(objects, prefix)):
+                    path = join(objects, prefix, file)
+                    hash = prefix + file.removesuffix(".tmp").lstrip(".").split(".")[0]
+
+                    if hash in referenced or time.time() - getmtime(path) < grace:
+                        continue
+
+                    freed += getsize(path)
+                    removed += 1
+                    os.remove(path)
+                    self.parsed.pop(hash, None)
+
+            return removed, freed
+
+    def size(self, name: str | None = None) -> int:
+        """Bytes the store takes on disk, or the manifests of one notebook take."""
+
+        top = self.notes_dir(name) if name is not None else self.root
+        return sum(getsize(join(root, file)) for root, _, files in os.walk(top) for file in files)
+
+
+def in_order(values: list[int]) -> set[int]:
+    """Positions of a longest increasing subsequence of values."""
+
+    tails, tail_positions, previous = [], [], [None] * len(values)
+
+    for i, value in enumerate(values):
+        low, high = 0, len(tails)
+        while low < high:
+            middle = (low + high) // 2
+            if tails[middle] < value:
+                low = middle + 1
+            else:
+                high = middle
+
+        previous[i] = tail_positions[low - 1] if low else None
+        if low == len(tails):
+            tails.append(value)
+            tail_positions.append(i)
+        else:
+            tails[low] = value
+            tail_positions[low] = i
+
+    kept = set()
+    i = tail_positions[-1] if tail_positions else None
+    while i is not None:
+        kept.add(i)
+        i = previous[i]
+
+    return kept
+
+
+def get_store(directory: str) -> Store:
+    return st_sd.shared(Store, directory)
+
+def update(path: str, block_id: int, records: list[st_s.Record], restored: str | None = None) -> None:
+    """Called after a save, adds a version of the notes at path. restored is the version they were restored from."""
+
+    get_store(dirname(path)).record(basename(path), block_id, records, restored)
+
+
+def describe(changes: list[Change]) -> str:
+    counts = {}
+    for change in changes:
+        counts[change.kind] = counts.get(change.kind, 0) + 1
+
+    return ", ".join(f"{count} {kind}" for kind, count in counts.items()) or "no changes"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Version history of the notes in the data directory.")
+    parser.add_argument("--data-dir", default=SECRETS["data_dir"], help="data_dir in secrets.toml by default")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("list", help="versions of a notebook, oldest first")
+    command.add_argument("name")
+
+    command = commands.add_parser("diff", help="what changed between two versions, or since one of them")
+    command.add_argument("name")
+    command.add_argument("old", help="version id (4 characters of it are usually enough), or a position: 1 is the oldest, -1 the newest")
+    command.add_argument("new", nargs="?", help="the notes as they are now by default")
+
+    command = commands.add_parser("restore", help="writes a version over the notebook, it becomes the newest version")
+    command.add_argument("name")
+    command.add_argument("version")
+
+    command = commands.add_parser("prune", help="drops the oldest versions of a notebook, gc frees their objects")
+    command.add_argument("name")
+    command.add_argument("--keep", type=int, required=True)
+
+    commands.add_parser("gc", help="removes the objects no version points to anymore")
+    args = parser.parse_args()
+
+    store = get_store(args.data_dir)
+
+    try:
+        match args.command:
+            case "list":
+                previous = None
+                for i, version in enumerate(store.versions(args.name), 1):
+                    saved = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(version.time))
+                    note = " (restored)" if version.restored else "" # same blocks, same id as the version it came from
+                    print(f"  {i:>4}  {version.id}  {saved}  {len(version.blocks):>5} blocks  {describe(store.diff(previous, version, lines=False))}{note}")
+                    previous = version
+
+                path = join(args.data_dir, args.name)
+                notes = sum(st_s.file_stat(path)[1::2]) if exists(path) else 0
+                print(f"manifests {store.size(args.name) / 1e6:.2f}MB, whole store {store.size() / 1e6:.2f}MB, notes {notes / 1e6:.2f}MB")
+
+            case "diff":
+                old = store.find(args.name, args.old)
+                new = store.find(args.name, args.new) if args.new else st_s.load(join(args.data_dir, args.name))[1]
+
+                for change in store.diff(old, new):
+                    print(f"  {change.kind:<8} {change.type} block {change.id}")
+                    for line in change.lines:
+                        print(f"      {line}")
+
+            case "restore":
+                version = store.restore(join(args.data_dir, args.name), args.version)
+                print(f"restored {args.name} to {version.id}")
+
+            case "prune":
+                print(f"dropped {store.prune(args.name, args.keep)} versions")
+
+            case "gc":
+                removed, freed = store.gc()
+                print(f"removed {removed} objects, {freed / 1e6:.2f}MB")
+
+    except KeyError as e:
+        print(e.args[0])
+        sys.exit(1)
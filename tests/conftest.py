@@ -0,0 +1,4 @@
+import sys
+from os.path import dirname, abspath
+
+sys.path.insert(0, dirname(dirname(abspath(__file__)))) # the modules live at the top of the repository
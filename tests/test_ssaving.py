@@ -0,0 +1,67 @@
+from threading import Event
+import time
+import sstorage as st_s
+import ssaving as st_sv
+
+
+def wait_idle(saver: st_sv.App, timeout: float = 10) -> None:
+    deadline = time.time() + timeout
+    while saver.thread is not None and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert saver.thread is None, "the saver didn't drain"
+
+def test_snapshots_of_other_notes_are_kept(tmp_path, monkeypatch):
+    """A, then B while the writer is busy with an earlier A: both files end up on disk, with their own records."""
+
+    writing, release = Event(), Event()
+    save = st_s.save
+
+    def blocked_save(*args):
+        writing.set()
+        release.wait(10)
+        save(*args)
+
+    monkeypatch.setattr(st_s, "save", blocked_save)
+
+    first, second = str(tmp_path / "first.notes"), str(tmp_path / "second.notes")
+    saver = st_sv.App()
+
+    saver.submit(st_sv.Snapshot(first, 2, [(0, "title", "First"), (1, "text", "draft")], {0, 1}, full=True))
+    assert writing.wait(10)
+
+    saver.submit(st_sv.Snapshot(first, 2, [(0, "title", "First"), (1, "text", "last edit")], {1}, full=False))
+    saver.submit(st_sv.Snapshot(second, 1, [(0, "title", "Second")], {0}, full=True))
+    release.set()
+    wait_idle(saver)
+
+    assert saver.status == "saved"
+    assert st_s.load(first) == (2, [(0, "title", "First"), (1, "text", "last edit")])
+    assert st_s.load(second) == (1, [(0, "title", "Second")])
+
+def test_a_pending_restore_is_still_recorded(tmp_path, monkeypatch):
+    writing, release = Event(), Event()
+    save = st_s.save
+    versions = []
+
+    def blocked_save(*args):
+        writing.set()
+        release.wait(10)
+        save(*args)
+
+    monkeypatch.setattr(st_s, "save", blocked_save)
+    monkeypatch.setattr(st_sv.st_v, "update", lambda path, block_id, records, restored=None: versions.append(restored))
+
+    path = str(tmp_path / "notes.notes")
+    saver = st_sv.App()
+
+    saver.submit(st_sv.Snapshot(path, 1, [(0, "title", "Notes")], {0}, full=True))
+    assert writing.wait(10)
+
+    saver.submit(st_sv.Snapshot(path, 1, [(0, "title", "Restored")], set(), full=True, restored="abc"))
+    saver.submit(st_sv.Snapshot(path, 1, [(0, "title", "Restored, then edited")], {0}, full=False)) # an autosave
+    release.set()
+    wait_idle(saver)
+
+    assert versions == [None, "abc"]
+    assert st_s.load(path) == (1, [(0, "title", "Restored, then edited")])